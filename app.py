@@ -1,83 +1,245 @@
 import streamlit as st
 import os
-from dotenv import load_dotenv
+import re
+import time
+import uuid
+import statistics
+import importlib
+import collections
+import concurrent.futures
+from types import SimpleNamespace
 
-# Load environment variables
-load_dotenv()
-os.environ["groq_api_key"] = os.getenv("groq_api_key")
+from settings import (GROQ_API_KEY, SECTION_CONCURRENCY, EDIT_MODE, GENERATION_SERVICE_URL, TOPIC_REUSE, SECTION_BATCHING,
+                      REPORT_MODE, SPECULATIVE_OUTLINE)
 
-# Import your existing code
-from langchain_groq import ChatGroq
-from pydantic import BaseModel, Field
-from typing_extensions import TypedDict, Annotated
-from typing import operator
-from langchain_core.messages import HumanMessage, SystemMessage
-from langgraph.types import Send
-from langgraph.graph import StateGraph, START, END
+import pdf_export
+from history import get_history
 
-# ================ Your existing code - NO CHANGES ================
-### Model 
-model = ChatGroq(model = "openai/gpt-oss-120b")
+if GENERATION_SERVICE_URL:
+    import client
 
-### Structured_Model
-class section(BaseModel):
-    name : str = Field(description= "It will contain topic in this blog")
-    description : str = Field(description= "it will contain description of the name/subtitle")
+# ================ Process-wide resources ================
+# Streamlit re-executes this script on every interaction. Everything below is built
+# once per server process and shared by all sessions.
+@st.cache_resource
+def perf_stats():
+    return {"first_render": None, "pipeline_load": None, "reruns": collections.deque(maxlen=200)}
 
-class sections(BaseModel):
-    sec : list[section] = Field(description="here we will have complete section")
-    
-structured_model = model.with_structured_output(sections)
+@st.cache_resource
+def pipeline_loader():
+    # The pipeline module builds the model, LLM cache, checkpointer and compiled graph
+    # at import time. Import it in the background so the first page render doesn't
+    # wait for LangChain/LangGraph; callers block on .result() only when they need it.
+    def load():
+        start = time.perf_counter()
+        module = importlib.import_module("pipeline")
+        return module, time.perf_counter() - start
+    return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-loader").submit(load)
 
-### State
-class State(TypedDict):
-    topic : str
-    section : list[section]
-    complete_sections: Annotated[list[str], operator.add]
-    report : str
-    final : str
+def load_pipeline():
+    module, seconds = pipeline_loader().result()
+    perf_stats()["pipeline_load"] = seconds
+    return module
 
-### Node
-def get_sections(state:State):
-    response = structured_model.invoke([SystemMessage(content=("You are an expert technical blog writer. ""Your task is to generate a clean, well-structured blog outline using the provided schema. ""Each item in the 'sec' list represents one section of the blog. ""For every section, provide: \n""1. 'name' → the section title\n""2. 'description' → a clear, concise explanation of what will be written in that section.\n\n""Guidelines:\n""- Begin with an introductory section.\n""- Follow with 4–8 logical sections covering the full topic.\n""- Keep descriptions short but meaningful (2–4 sentences).\n""- Maintain logical flow from basic to advanced.\n""- Do NOT add content outside the schema. Only return fields defined in the schema.\n""- Output MUST strictly follow the Pydantic 'sections' structure.\n""Wait for the user's query and generate sections accordingly.")),
-                                        HumanMessage(content=f"Here is the topic name of my blog {state['topic']}")])
-    print(response.sec)
-    return {"section" : response.sec}
+@st.cache_resource
+def load_css():
+    # Read and minify the stylesheet once; each rerun re-sends the same compact string
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "style.css"), encoding="utf-8") as f:
+        css = f.read()
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css).strip()
+    return f"<style>{css}</style>"
 
-def each_section_output(state:State):
-    response = model.invoke([SystemMessage(content=("You are a professional technical writer. Use Markdown Format to generate. Your job is to generate full blog content ""based strictly on the provided section names and descriptions.\n\n""For each section in the input:\n""- Use the 'name' as the section heading.\n""- Use the 'description' to guide the depth, theme, and direction of writing.\n""- Expand each section into a detailed, well-written explanation (150–300 words per section).\n""- Write in clear, simple, expert-level English.\n""- Do NOT rewrite the outline.\n""- Do NOT add new sections.\n""- Do NOT return JSON.\n""- Only return the final written blog content, properly formatted with headings.\n")),
-                             HumanMessage(content=f"here is the name of the subtopic : {state['section'].name} and description is {state['section'].description}")])
-    return {"complete_sections" : [response.content]}
+def render_perf(perf_box):
+    stats = perf_stats()
+    reruns = list(stats["reruns"])
+    with perf_box.expander("⏱️ Performance", expanded=False):
+        load = stats["pipeline_load"]
+        if not GENERATION_SERVICE_URL:
+            st.caption(f"Pipeline build (cold start): {f'{load:.2f} s' if load is not None else 'loading in background…'}")
+        if stats["first_render"] is not None:
+            st.caption(f"First page render: {stats['first_render'] * 1000:.0f} ms")
+        if reruns:
+            st.caption(f"Rerun: last {reruns[-1] * 1000:.0f} ms · median {statistics.median(reruns) * 1000:.0f} ms "
+                       f"over {len(reruns)} reruns")
 
-def assign_worker(state: State):
-    return [Send("each_section_output", {"section": s}) for s in state["section"]]
+# ================ Report runs ================
+# Both yield ("update", node, update), ("token", "final", text), ("resumed", None, None),
+# ("reused", None, reused_from) and ("attached", None, None) events, and leave the run's
+# metrics summary and node rows in `run` when it completes. ("retry", "final", None) means
+# the final edit is tried again and its streamed tokens are void. A service job also
+# yields ("restarted", None, None) when its worker died: the updates so far are sent again.
+def local_run(topic, concurrency, edit, reuse, batching, length, run, revision=None):
+    # The graph runs in this process, on the pipeline's shared event loop.
+    # One checkpointed thread per report: it is kept until the run completes, so
+    # clicking Generate again after a failure resumes from the last finished step.
+    # Threads are per edit mode and length too: a run only resumes with the settings
+    # it started with
+    threads = st.session_state.setdefault("threads", {})
+    pipeline = load_pipeline()
+    from metrics import RunMetrics, export
+    run_metrics = RunMetrics()
+    # Model calls are queued fairly per browser session (see scheduler.py)
+    session = st.session_state.setdefault("session_id", pipeline.new_thread_id())
+    if revision:
+        # A revision (previous state, edited outline, sections to rewrite) redoes only what changed,
+        # in the report mode the report was generated with: a chapter is rewritten as a chapter
+        config = pipeline.run_config(concurrency, None, "mapreduce", [run_metrics], session, "off", batching,
+                                     revision[0].get("mode") or length)
+        try:
+            yield from pipeline.iter_sync(pipeline.run_events(pipeline.revision_input(*revision), {}, config))
+        finally:
+            export(run_metrics)
+        run["summary"], run["node_rows"] = run_metrics.summary(), run_metrics.node_rows()
+        run["state"] = {**pipeline.run_sync(pipeline.finish_run(config, run["summary"])), "mode": pipeline.report_mode(config)}
+        return
+    config = pipeline.run_config(concurrency, threads.setdefault((topic, edit, length), pipeline.new_thread_id()), edit, [run_metrics],
+                                 session, reuse, batching, length)
 
-def report(state : State):
-    respose = state["complete_sections"]
-    res = '\n\n----\n\n'.join(respose)
-    return {"report" : res}
+    async def start(flight):
+        graph_input, restored = await pipeline.prepare_run(topic, config)
+        try:
+            async for event in pipeline.run_events(graph_input, restored, config):
+                flight.publish(event)
+        finally:
+            export(run_metrics)
+        summary = run_metrics.summary()
+        return {"summary": summary, "node_rows": run_metrics.node_rows(),
+                "state": {**await pipeline.finish_run(config, summary), "mode": pipeline.report_mode(config)}}
 
-def final(state : State):
-    response = model.invoke([SystemMessage(content=("You are an expert editor and technical content specialist. Your task is to take the complete blog ""provided by the user and refine it for final publication.\n\n""Your responsibilities:\n""- Improve clarity, flow, and readability without changing the meaning.\n""- Fix grammar, punctuation, and sentence structure.\n""- Enhance transitions between ideas so the blog reads smoothly.\n""- Strengthen the tone to sound polished, professional, and engaging.\n""- Keep all technical details, facts, and structure exactly as provided.\n""- Do NOT add new sections or new concepts.\n""- Do NOT remove user-provided content unless it is repetitive or unclear.\n""- Do NOT alter the factual meaning.\n""- Return ONLY the improved blog text — no explanations, no bullet points, no commentary.\n\n""Your goal is to make the blog feel complete, publication-ready, and professional.")),
-                             HumanMessage(content=f"Here is the full blog {state['report']}")])
-    return {"final" : response.content}
+    # The same report already being generated for anyone in this process is followed
+    # (from its first event) instead of generated twice
+    flight, attached = pipeline.run_sync(pipeline.flights.join(pipeline.flight_key(topic, config), start))
+    if attached:
+        yield "attached", None, None
+    yield from pipeline.iter_sync(flight.follow())
+    run.update(flight.result)
 
-### StateGraph
-graph = StateGraph(State)
-graph.add_node("get_sections", get_sections)
-graph.add_node("each_section_output", each_section_output)
-graph.add_node("report", report)
-graph.add_node("final", final)
-graph.add_edge(START, "get_sections")
-graph.add_conditional_edges("get_sections", assign_worker, ["each_section_output"])
-graph.add_edge("each_section_output", "report")
-graph.add_edge("report","final")
-graph.add_edge("final", END)
-graph = graph.compile()
-# ================ END of your existing code ================
+def remote_run(job_id, run, attached=False):
+    # The job runs in a generation service worker; its events are replayed from the start
+    if attached:
+        yield "attached", None, None
+    for event in client.job_events(job_id):
+        data = event["data"]
+        if event["type"] == "update":
+            update = data["update"]
+            if "section" in update:
+                update["section"] = [SimpleNamespace(**sec) for sec in update["section"]]
+            yield "update", data["node"], update
+        elif event["type"] == "token":
+            yield "token", "final", data["text"]
+        elif event["type"] in ("resumed", "restarted"):
+            yield event["type"], None, None
+        elif event["type"] == "retry":
+            yield "retry", data["node"], None
+        elif event["type"] == "reused":
+            yield "reused", None, data
+        elif event["type"] == "error":
+            raise RuntimeError(data["error"])
+        elif event["type"] == "done":
+            run["summary"], run["node_rows"] = data["metrics"], data["node_rows"]
+            # Revisions of a service job are built by the service from its stored result
+            result = client.job_result(job_id)
+            run["state"] = {"job_id": job_id, "topic": result["topic"],
+                            "section": [SimpleNamespace(**sec) for sec in result["outline"]],
+                            "failed_sections": result.get("failed_sections", [])}
 
 # ================ Streamlit UI with DARK THEME ================
+def render_outline(outline):
+    for i, sec in enumerate(outline, 1):
+        with st.expander(f"**Section {i}: {sec.name}**", expanded=i==1):
+            st.markdown(f"""
+            <div class="section-card">
+                <div style="display: flex; align-items: center; margin-bottom: 10px;">
+                    <span style="background: #3B82F6; color: white; padding: 2px 10px; border-radius: 12px; font-size: 0.8rem; margin-right: 10px;">
+                        Section {i}
+                    </span>
+                    <span style="color: #60A5FA; font-size: 0.9rem;">
+                        {len(sec.description.split())} words planned
+                    </span>
+                </div>
+                <p style="color: #E2E8F0; line-height: 1.6; margin: 0;">
+                <strong>Description:</strong><br>
+                {sec.description}
+                </p>
+            </div>
+            """, unsafe_allow_html=True)
+
+# ================ Report history ================
+@st.fragment
+def history_browser(history):
+    # Typing a search or turning a page reruns only this fragment; opening a report
+    # reruns the page so it is shown in the main area
+    query = st.text_input("Search past reports", placeholder="Words from the topic or text…").strip()
+    paging = st.session_state.setdefault("history_paging", {"query": "", "cursors": [None]})
+    if paging["query"] != query:
+        paging.update(query=query, cursors=[None])
+    cursors = paging["cursors"]
+    rows, next_cursor = history.search(query, cursors[-1]) if query else history.page(cursors[-1])
+    if not rows:
+        st.caption("No matching reports" if query else "Generated reports will be listed here")
+    for row in rows:
+        if st.button(f"📄 {row['topic']}", key=f"history-{row['id']}", width="stretch"):
+            st.session_state["opened_report"] = row["id"]
+            # Otherwise the next rerun reattaches to the job in the URL instead
+            st.query_params.pop("job", None)
+            st.rerun()
+        st.caption(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(row['created']))} · {row['sections']} sections · "
+                   f"{row['words']} words")
+        if row.get("excerpt"):
+            st.caption(row["excerpt"])
+    newer, older = st.columns(2)
+    newer.button("← Previous", key="history-previous", disabled=len(cursors) == 1, on_click=cursors.pop, width="stretch")
+    older.button("Next →", key="history-next", disabled=next_cursor is None, on_click=cursors.append, args=(next_cursor,),
+                 width="stretch")
+
+def render_saved_report(history, report_id):
+    # A report reopened from the history: the texts are only read now
+    record = history.get(report_id)
+    if record is None:
+        st.session_state.pop("opened_report", None)
+        return
+    topic = record["topic"]
+    st.markdown(f"### 📚 {topic}")
+    details = [time.strftime("%Y-%m-%d %H:%M", time.localtime(record["created"])), f"{record['sections']} sections",
+               f"{record['words']} words"]
+    if record["metrics"]:
+        summary = record["metrics"]
+        details += [f"{summary['wall_s']:.1f} s", f"{summary['input_tokens'] + summary['output_tokens']:,} tokens",
+                    f"${summary['cost_usd']:.4f}"]
+    st.caption(" · ".join(details))
+    tab1, tab2, tab3 = st.tabs(["📋 Outline", "✍️ Draft", "✨ Final"])
+    with tab1:
+        render_outline([SimpleNamespace(**sec) for sec in record["outline"]])
+    with tab2:
+        st.markdown(record["report"] or "\n\n----\n\n".join(record["drafts"]))
+    with tab3:
+        st.markdown(record["final"])
+    col1, col2, col3 = st.columns(3)
+    col1.download_button("📥 Download (Markdown)", data=record["final"],
+                         file_name=f"{topic.replace(' ', '_').lower()}_blog.md", mime="text/markdown")
+    col2.download_button("📄 Download (PDF)", data=lambda: pdf_export.pdf_bytes(record["final"], topic),
+                         file_name=f"{topic.replace(' ', '_').lower()}_blog.pdf", mime="application/pdf")
+    if col3.button("🗑️ Delete from history"):
+        history.delete(report_id)
+        st.session_state.pop("opened_report", None)
+        st.rerun()
+
+def open_for_revision(record):
+    # The reopened report becomes the one the Revise panel works on (local runs only:
+    # the service revises its own jobs)
+    pipeline = load_pipeline()
+    return {"topic": record["topic"], "section": [pipeline.section(**sec) for sec in record["outline"]],
+            "complete_sections": record["drafts"], "edited_sections": record["edited"],
+            "final_sections": record["final_sections"], "mode": record["mode"],
+            "failed_sections": [sec["name"] for sec, draft in zip(record["outline"], record["drafts"])
+                                if pipeline.FAILED_NOTE in draft]}
+
 def main():
+    rerun_start = time.perf_counter()
+    # A thin client of the generation service never builds the pipeline itself
+    loader = None if GENERATION_SERVICE_URL else pipeline_loader()
+    
     # Page configuration
     st.set_page_config(
         page_title="AI Blog Generator",
@@ -87,224 +249,7 @@ def main():
     )
     
     # Custom CSS for DARK THEME
-    st.markdown("""
-    <style>
-    /* Main app background */
-    .stApp {
-        background-color: #0E1117;
-        color: #FFFFFF;
-    }
-    
-    /* Headers */
-    .main-header {
-        font-size: 2.8rem;
-        font-weight: 800;
-        background: linear-gradient(45deg, #00D4FF, #0095FF, #7C3AED);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        text-align: center;
-        margin-bottom: 1.5rem;
-        padding: 10px;
-        letter-spacing: 0.5px;
-    }
-    
-    .sub-header {
-        font-size: 1.3rem;
-        color: #B0B7C3;
-        text-align: center;
-        margin-bottom: 2.5rem;
-        font-weight: 300;
-    }
-    
-    /* Buttons */
-    .stButton>button {
-        background: linear-gradient(45deg, #0095FF, #7C3AED);
-        color: white !important;
-        border: none;
-        padding: 0.7rem 2.5rem;
-        border-radius: 12px;
-        font-weight: 600;
-        width: 100%;
-        transition: all 0.3s ease;
-        font-size: 1.1rem;
-    }
-    
-    .stButton>button:hover {
-        transform: translateY(-3px);
-        box-shadow: 0 8px 25px rgba(0, 149, 255, 0.4);
-        background: linear-gradient(45deg, #00D4FF, #0095FF);
-    }
-    
-    .stButton>button:disabled {
-        background: #2A2D34;
-        color: #6B7280 !important;
-    }
-    
-    /* Cards */
-    .blog-card {
-        background: linear-gradient(145deg, #1A1D23, #16181E);
-        border-radius: 16px;
-        padding: 2rem;
-        box-shadow: 0 8px 30px rgba(0, 0, 0, 0.3);
-        margin: 1.2rem 0;
-        border: 1px solid #2A2D34;
-        color: #FFFFFF;
-    }
-    
-    .outline-card {
-        background: linear-gradient(135deg, #1E3A8A 0%, #7C3AED 100%);
-        color: white;
-        border-radius: 16px;
-        padding: 1.8rem;
-        margin: 1.2rem 0;
-        border: 1px solid #3B82F6;
-    }
-    
-    .section-card {
-        background: linear-gradient(145deg, #1E293B, #0F172A);
-        border-left: 5px solid #3B82F6;
-        border-radius: 12px;
-        padding: 1.2rem 1.5rem;
-        margin: 0.8rem 0;
-        box-shadow: 0 4px 15px rgba(0, 0, 0, 0.2);
-        color: #E2E8F0;
-    }
-    
-    /* Progress container */
-    .progress-container {
-        background: #1A1D23;
-        border-radius: 12px;
-        padding: 1.5rem;
-        margin: 1.2rem 0;
-        border: 1px solid #2A2D34;
-    }
-    
-    /* Text input */
-    .stTextInput>div>div>input {
-        background-color: #1A1D23;
-        color: #FFFFFF;
-        border: 2px solid #2A2D34;
-        border-radius: 12px;
-        padding: 0.8rem 1rem;
-        font-size: 1rem;
-    }
-    
-    .stTextInput>div>div>input:focus {
-        border-color: #3B82F6;
-        box-shadow: 0 0 0 2px rgba(59, 130, 246, 0.2);
-    }
-    
-    /* Tabs */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 8px;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        background-color: #1A1D23;
-        color: #B0B7C3;
-        border-radius: 10px 10px 0 0;
-        padding: 10px 20px;
-        border: 1px solid #2A2D34;
-        border-bottom: none;
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background-color: #3B82F6 !important;
-        color: #FFFFFF !important;
-        font-weight: 600;
-    }
-    
-    /* Expander */
-    .streamlit-expanderHeader {
-        background-color: #1A1D23;
-        color: #FFFFFF;
-        border: 1px solid #2A2D34;
-        border-radius: 10px;
-        font-weight: 600;
-    }
-    
-    .streamlit-expanderContent {
-        background-color: #16181E;
-        color: #FFFFFF;
-        border-radius: 0 0 10px 10px;
-    }
-    
-    /* Sidebar */
-    [data-testid="stSidebar"] {
-        background: linear-gradient(180deg, #1A1D23, #0F172A);
-    }
-    
-    [data-testid="stSidebar"] .stButton>button {
-        background: linear-gradient(45deg, #7C3AED, #3B82F6);
-    }
-    
-    /* Markdown text */
-    .stMarkdown {
-        color: #FFFFFF;
-    }
-    
-    .stMarkdown h1, .stMarkdown h2, .stMarkdown h3, .stMarkdown h4 {
-        color: #FFFFFF;
-    }
-    
-    .stMarkdown p {
-        color: #D1D5DB;
-    }
-    
-    /* Code blocks */
-    .stCodeBlock {
-        background-color: #1E293B;
-        border-radius: 10px;
-        border: 1px solid #334155;
-    }
-    
-    /* Metrics */
-    [data-testid="stMetricValue"] {
-        color: #FFFFFF;
-        font-size: 1.8rem;
-        font-weight: 700;
-    }
-    
-    [data-testid="stMetricLabel"] {
-        color: #B0B7C3;
-    }
-    
-    /* Divider */
-    hr {
-        border-color: #2A2D34;
-        margin: 2rem 0;
-    }
-    
-    /* Spinner */
-    .stSpinner > div {
-        border-color: #3B82F6 transparent transparent transparent;
-    }
-    
-    /* Success/Error/Info messages */
-    .stAlert {
-        background-color: #1A1D23;
-        border: 1px solid #2A2D34;
-        border-radius: 12px;
-        color: #FFFFFF;
-    }
-    
-    /* Download button */
-    .stDownloadButton>button {
-        background: linear-gradient(45deg, #10B981, #059669);
-        color: white !important;
-        border: none;
-        padding: 0.7rem 2rem;
-        border-radius: 10px;
-        font-weight: 600;
-        margin-top: 1rem;
-    }
-    
-    .stDownloadButton>button:hover {
-        background: linear-gradient(45deg, #34D399, #10B981);
-        transform: translateY(-2px);
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    st.markdown(load_css(), unsafe_allow_html=True)
     
     # Header
     st.markdown('<h1 class="main-header">🤖 AI Blog Generator</h1>', unsafe_allow_html=True)
@@ -316,13 +261,92 @@ def main():
         st.markdown("---")
         
         # API Key check
-        api_key = os.getenv("groq_api_key")
-        if not api_key:
+        if not GROQ_API_KEY:
             st.error("⚠️ GROQ API Key not found!")
             st.info("Please set your GROQ_API_KEY in the .env file")
         else:
             st.success("✅ GROQ API Key loaded")
         
+        concurrency = st.slider(
+            "Parallel section writers",
+            min_value=1,
+            max_value=16,
+            value=min(SECTION_CONCURRENCY, 16),
+            help="How many sections are written at the same time"
+        )
+        
+        edit = st.radio(
+            "Editing mode",
+            options=["single", "mapreduce"],
+            index=0 if EDIT_MODE == "single" else 1,
+            format_func=lambda mode: {"single": "Single pass (whole blog)", "mapreduce": "Per section (parallel)"}[mode],
+            help="Per-section editing polishes each section as soon as it is written, then only smooths the transitions"
+        )
+        
+        # Service workers use their own REPORT_MODE / SECTION_BATCHING settings
+        length = st.selectbox(
+            "Report length",
+            options=["blog", "long"],
+            index=0 if REPORT_MODE == "blog" else 1,
+            format_func=lambda mode: {"blog": "Blog (4–8 sections)", "long": "Long report (chapters of sub-sections)"}[mode],
+            disabled=bool(GENERATION_SERVICE_URL),
+            help="A long report plans chapters, then writes and edits each chapter on its own"
+        )
+        
+        reuse = st.selectbox(
+            "Reuse similar past topics",
+            options=["off", "outline", "sections"],
+            index=["off", "outline", "sections"].index(TOPIC_REUSE),
+            format_func=lambda mode: {"off": "Off", "outline": "Outline only", "sections": "Outline and section drafts"}[mode],
+            help="When a past topic is worded differently but means the same, start from what was written for it"
+        )
+        
+        batching = "auto" if st.toggle(
+            "Batch section writes",
+            value=SECTION_BATCHING == "auto",
+            disabled=bool(GENERATION_SERVICE_URL),
+            help="Write several sections per model call: fewer requests and prompt tokens, sized to the current rate limits"
+        ) else "off"
+        
+        speculative = st.toggle(
+            "Speculative outline",
+            value=SPECULATIVE_OUTLINE,
+            disabled=bool(GENERATION_SERVICE_URL),
+            help="Start writing the outline in the background as soon as the topic is entered, before Generate is clicked"
+        ) and not GENERATION_SERVICE_URL
+        
+        if GENERATION_SERVICE_URL:
+            health = client.service_health()
+            if health is None:
+                st.caption("🛰️ Generation service unreachable")
+            else:
+                st.caption(f"🛰️ Generation service: {health['workers']} workers · {health.get('queued', 0)} queued · "
+                           f"{health.get('running', 0)} running")
+        
+        llm_cache = loader.result()[0].llm_cache if loader and loader.done() else None
+        if llm_cache is not None:
+            stats = llm_cache.stats()
+            st.caption(
+                f"🗄️ LLM cache: {stats['memory_hits'] + stats['disk_hits']} hits · "
+                f"{stats['misses']} misses · {stats['disk_entries']} entries ({stats['disk_mb']} MB)"
+            )
+        if loader and loader.done():
+            queue = loader.result()[0].scheduler.snapshot()
+            st.caption(
+                f"🚦 Groq queue: {queue['queue_depth']} waiting ({queue['waiting_sessions']} sessions) · "
+                f"{queue['throttled']} throttled · {queue['rate_limited']} rate-limited · {queue['retries']} retries"
+            )
+            if speculative:
+                spec = loader.result()[0].speculation_stats
+                st.caption(f"⚡ Speculative outlines: {spec['used']} used · {spec['started']} written · "
+                           f"{spec['cancelled']} cancelled")
+        
+        history = get_history()
+        if history is not None:
+            st.markdown("---")
+            st.markdown("## 📚 History")
+            history_browser(history)
+        
         st.markdown("---")
         st.markdown("## 📝 How it works")
         st.markdown("""
@@ -346,6 +370,7 @@ def main():
         """)
         st.markdown("---")
         st.markdown("Made with ❤️ using Streamlit & LangGraph")
+        perf_box = st.empty()
     
     # Main content area
     col1, col2 = st.columns([1, 1])
@@ -374,6 +399,47 @@ def main():
             disabled=not topic,
             help="Click to start generating your blog post" if topic else "Please enter a topic first"
         )
+        
+        # The outline of the topic as entered starts in the background (after a short
+        # debounce); Generate picks it up if the topic is still the same by then
+        if speculative and topic and not generate_button and loader.done():
+            pipeline = loader.result()[0]
+            session = st.session_state.setdefault("session_id", pipeline.new_thread_id())
+            pipeline.speculate(topic, pipeline.run_config(concurrency, None, edit, None, session, reuse, batching, length))
+        
+        # Incremental revision of the last report: only changed or flagged sections are rewritten
+        revision = None
+        opened = st.session_state.get("opened_report")
+        if opened and history is not None and not GENERATION_SERVICE_URL and st.session_state.get("revising") != opened:
+            record = history.get(opened)
+            if record is not None:
+                st.session_state["last_run"], st.session_state["revising"] = open_for_revision(record), opened
+        last_run = st.session_state.get("last_run")
+        if last_run:
+            with st.expander(f"✏️ Revise: {last_run['topic']}", expanded=False):
+                st.caption("Rename, reorder (Position), add or delete sections, or tick Rewrite. "
+                           "Unchanged sections and the transitions between them are kept.")
+                # Sections that failed last time are ticked already
+                failed = set(last_run.get("failed_sections") or [])
+                rows = st.data_editor(
+                    [{"Position": i, "Section": sec.name, "Description": sec.description, "Rewrite": sec.name in failed}
+                     for i, sec in enumerate(last_run["section"], 1)],
+                    num_rows="dynamic",
+                    key=f"revise-{id(last_run)}",
+                )
+                if st.button("♻️ Regenerate changed sections"):
+                    rows = [row for row in rows if (row.get("Section") or "").strip()]
+                    rows = sorted(enumerate(rows), key=lambda item: (item[1].get("Position") or float("inf"), item[0]))
+                    outline = [{"name": row["Section"].strip(), "description": (row.get("Description") or "").strip()}
+                               for _, row in rows]
+                    rewrite = {i for i, (_, row) in enumerate(rows) if row.get("Rewrite")}
+                    # Kept sections are matched by name, so two sections can't share one
+                    names = [sec["name"] for sec in outline]
+                    duplicates = sorted({name for name in names if names.count(name) > 1})
+                    if duplicates:
+                        st.error(f"Each section needs its own name: {', '.join(duplicates)}")
+                    else:
+                        revision = (last_run, outline, rewrite)
     
     with col2:
         st.markdown("### 📊 Preview")
@@ -410,7 +476,34 @@ def main():
             """, unsafe_allow_html=True)
     
     # Main generation area
-    if generate_button and topic:
+    # With a generation service the job id lives in the URL, so a page reload
+    # reattaches to the running (or finished) job instead of losing it
+    job_id, attached = None, False
+    if revision:
+        topic, edit = revision[0]["topic"], "mapreduce"
+    if GENERATION_SERVICE_URL:
+        if revision:
+            session = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+            job_id, attached = client.submit_job(topic, edit, concurrency, session,
+                                                 revision={"previous": revision[0]["job_id"], "outline": revision[1],
+                                                           "rewrite": sorted(revision[2])})
+            st.query_params["job"] = job_id
+        elif generate_button and topic:
+            threads = st.session_state.setdefault("threads", {})
+            session = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+            job_id, attached = client.submit_job(topic, edit, concurrency, session, threads.setdefault((topic, edit, length), uuid.uuid4().hex),
+                                                 reuse)
+            st.query_params["job"] = job_id
+        elif st.query_params.get("job"):
+            job = client.job_status(st.query_params["job"])
+            if job is None:
+                del st.query_params["job"]
+            else:
+                job_id, topic, edit = job["id"], job["topic"], job["edit_mode"]
+    
+    if (generate_button and topic) or revision or job_id:
+        st.session_state.pop("opened_report", None)
+        st.session_state.pop("revising", None)
         # Create progress indicators
         progress_bar = st.progress(0)
         status_text = st.empty()
@@ -418,102 +511,175 @@ def main():
         # Create tabs for different outputs
         tab1, tab2, tab3 = st.tabs(["📋 Blog Outline", "✍️ Generated Blog", "✨ Final Polished Version"])
         
-        # Step 1: Generate outline
-        with st.spinner("Creating blog outline..."):
-            status_text.text("Step 1/4: Creating blog outline...")
-            progress_bar.progress(25)
-            
-            # Run the graph
-            result = graph.invoke({"topic": topic})
-            
-            # Display outline in first tab
-            with tab1:
-                st.markdown("### 📋 Blog Outline")
-                st.markdown(f"**Topic:** {topic}")
-                st.markdown("---")
-                
-                if 'section' in result and result['section']:
-                    for i, sec in enumerate(result['section'], 1):
-                        with st.expander(f"**Section {i}: {sec.name}**", expanded=i==1):
-                            st.markdown(f"""
-                            <div class="section-card">
-                                <div style="display: flex; align-items: center; margin-bottom: 10px;">
-                                    <span style="background: #3B82F6; color: white; padding: 2px 10px; border-radius: 12px; font-size: 0.8rem; margin-right: 10px;">
-                                        Section {i}
-                                    </span>
-                                    <span style="color: #60A5FA; font-size: 0.9rem;">
-                                        {len(sec.description.split())} words planned
+        with tab1:
+            st.markdown("### 📋 Blog Outline")
+            st.markdown(f"**Topic:** {topic}")
+            st.markdown("---")
+            outline_box = st.empty()
+            outline_box.info("No outline generated yet")
+        
+        with tab2:
+            st.markdown("### ✍️ Draft Version")
+            draft_box = st.empty()
+            draft_box.info("Draft not available yet")
+        
+        with tab3:
+            st.markdown("### ✨ Final Polished Blog")
+            final_box = st.empty()
+            final_box.info("Final version not available yet")
+        
+        # Stream the run: node updates fill the tabs as soon as each node finishes,
+        # and the tokens of the final editor are streamed straight into tab 3
+        result = {"topic": topic, "section": [], "complete_sections": [], "failed_sections": []}
+        run = {}
+        final_tokens = []
+        polished = []
+        draft_slots = []
+        status_text.text("Step 1/4: Creating blog outline...")
+        progress_bar.progress(5)
+        
+        with st.spinner("Generating your blog..."):
+            events = remote_run(job_id, run, attached) if job_id else local_run(topic, concurrency, edit, reuse, batching, length, run, revision)
+            try:
+                for kind, node, update in events:
+                    if kind == "restarted":
+                        # The service replays the job from its checkpoint: start the tabs over
+                        result.update(section=[], complete_sections=[], failed_sections=[])
+                        final_tokens.clear()
+                        polished.clear()
+                        draft_slots = []
+                        outline_box.info("No outline generated yet")
+                        draft_box.info("Draft not available yet")
+                        final_box.info("Final version not available yet")
+                        status_text.text("Step 1/4: Creating blog outline...")
+                        progress_bar.progress(5)
+                        continue
+                    if kind == "resumed":
+                        st.info("♻️ Resuming the previous attempt — finished steps are reused")
+                        continue
+                    if kind == "attached":
+                        st.info("🔗 This report is already being generated — following that run instead of starting another")
+                        continue
+                    if kind == "reused":
+                        st.info(f"🔁 Reusing the outline{' and section drafts' if update['sections'] else ''} of a similar "
+                                f"past topic: “{update['topic']}” (similarity {update['score']:.2f})")
+                        continue
+                    if kind == "retry":
+                        # Only the streamed single-pass edit is shown before the final update
+                        if final_tokens:
+                            final_tokens.clear()
+                            final_box.info("Retrying the final edit...")
+                        continue
+                    if kind == "token":
+                        # A long report's final pass only rewrites the openings of its chapters
+                        if edit == "single" and length == "blog":
+                            final_tokens.append(update)
+                            final_box.markdown("".join(final_tokens))
+                        continue
+                    
+                    # Step 1: outline is ready
+                    if node == "get_sections":
+                        result["section"] = update["section"]
+                        with outline_box.container():
+                            render_outline(result["section"])
+                        draft_view = draft_box.container()
+                        draft_slots = [draft_view.empty() for _ in result["section"]]
+                        for slot in draft_slots:
+                            slot.info("Writing section...")
+                        status_text.text("Step 2/4: Writing individual sections...")
+                        progress_bar.progress(25)
+                    
+                    # Step 2: sections arrive in the order the workers finish
+                    elif node in ("each_section_output", "write_chapter"):
+                        done = len(result["complete_sections"])
+                        result["complete_sections"] += update["complete_sections"]
+                        result["failed_sections"] += update.get("failed_sections") or []
+                        # A batched worker delivers several consecutive sections at once
+                        for slot, draft in zip(draft_slots[done:], update["complete_sections"]):
+                            slot.markdown(draft + "\n\n----")
+                        total = max(len(result["section"]), 1)
+                        progress_bar.progress(25 + int(45 * len(result["complete_sections"]) / total))
+                        # Per-section editing: polished sections show up in tab 3 right away
+                        if update.get("edited_sections"):
+                            polished += update["edited_sections"]
+                            final_box.markdown("\n\n".join(polished))
+                    
+                    # Step 3: the joined draft in outline order replaces the streamed sections
+                    elif node == "report":
+                        result["report"] = update["report"]
+                        with draft_box.container():
+                            st.markdown("""
+                            <div class="blog-card">
+                                <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 1.5rem;">
+                                    <h4 style="color: #00D4FF; margin: 0;">Draft Version</h4>
+                                    <span style="background: #F59E0B; color: white; padding: 4px 12px; border-radius: 20px; font-size: 0.8rem;">
+                                        AI-Generated Draft
                                     </span>
                                 </div>
-                                <p style="color: #E2E8F0; line-height: 1.6; margin: 0;">
-                                <strong>Description:</strong><br>
-                                {sec.description}
-                                </p>
-                            </div>
                             """, unsafe_allow_html=True)
-                else:
-                    st.info("No outline generated yet")
-        
-        # Step 2: Writing sections
-        with st.spinner("Writing blog sections..."):
-            status_text.text("Step 2/4: Writing individual sections...")
-            progress_bar.progress(50)
+                            st.markdown(result['report'])
+                            st.markdown('</div>', unsafe_allow_html=True)
+                        status_text.text("Step 3/4: Editing and polishing...")
+                        progress_bar.progress(75)
+                    
+                    elif node == "final":
+                        result["final"] = update["final"]
+            except Exception as exc:
+                status_text.text("❌ Generation failed")
+                st.error(f"Generation failed: {exc}")
+                st.info("Click Generate again to resume — the outline and finished sections are kept.")
+                if job_id:
+                    del st.query_params["job"]
+                st.stop()
             
-            # Display draft in second tab
-            with tab2:
-                st.markdown("### ✍️ Draft Version")
-                if 'report' in result and result['report']:
-                    st.markdown("""
-                    <div class="blog-card">
-                        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 1.5rem;">
-                            <h4 style="color: #00D4FF; margin: 0;">Draft Version</h4>
-                            <span style="background: #F59E0B; color: white; padding: 4px 12px; border-radius: 20px; font-size: 0.8rem;">
-                                AI-Generated Draft
-                            </span>
-                        </div>
-                    """, unsafe_allow_html=True)
-                    st.markdown(result['report'])
-                    st.markdown('</div>', unsafe_allow_html=True)
-                else:
-                    st.info("Draft not available yet")
+            st.session_state.get("threads", {}).pop((topic, edit, length), None)
+            st.session_state["last_run"] = run["state"]
         
-        # Step 3: Final editing
-        with st.spinner("Polishing final version..."):
-            status_text.text("Step 3/4: Editing and polishing...")
-            progress_bar.progress(75)
-            
-            # Display final version in third tab
-            with tab3:
-                st.markdown("### ✨ Final Polished Blog")
-                if 'final' in result and result['final']:
-                    st.markdown("""
-                    <div class="blog-card">
-                        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 1.5rem;">
-                            <h4 style="color: #10B981; margin: 0;">Final Version</h4>
-                            <span style="background: #10B981; color: white; padding: 4px 12px; border-radius: 20px; font-size: 0.8rem;">
-                                Publication Ready
-                            </span>
-                        </div>
-                    """, unsafe_allow_html=True)
-                    st.markdown(result['final'])
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    # Download button
-                    st.download_button(
-                        label="📥 Download Blog (Markdown)",
-                        data=result['final'],
-                        file_name=f"{topic.replace(' ', '_').lower()}_blog.md",
-                        mime="text/markdown",
-                    )
-                else:
-                    st.info("Final version not available yet")
+        # Display final version in third tab
+        if result.get('final'):
+            with final_box.container():
+                st.markdown("""
+                <div class="blog-card">
+                    <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 1.5rem;">
+                        <h4 style="color: #10B981; margin: 0;">Final Version</h4>
+                        <span style="background: #10B981; color: white; padding: 4px 12px; border-radius: 20px; font-size: 0.8rem;">
+                            Publication Ready
+                        </span>
+                    </div>
+                """, unsafe_allow_html=True)
+                st.markdown(result['final'])
+                st.markdown('</div>', unsafe_allow_html=True)
+                
+                # Download button
+                st.download_button(
+                    label="📥 Download Blog (Markdown)",
+                    data=result['final'],
+                    file_name=f"{topic.replace(' ', '_').lower()}_blog.md",
+                    mime="text/markdown",
+                )
+                # The PDF starts rendering in the background now; the button reads the
+                # cached file (waiting for the render only if it hasn't finished yet)
+                final_text = result['final']
+                pdf_export.export_pdf(final_text, topic)
+                st.download_button(
+                    label="📄 Download Blog (PDF)",
+                    data=lambda: pdf_export.pdf_bytes(final_text, topic),
+                    file_name=f"{topic.replace(' ', '_').lower()}_blog.pdf",
+                    mime="application/pdf",
+                )
         
         # Completion
         status_text.text("✅ Blog generation complete!")
         progress_bar.progress(100)
         
         # Success message
-        st.success("🎉 Your blog has been generated successfully!")
+        if result["failed_sections"]:
+            # The run went on without the sections whose writer failed; they are placeholders
+            st.warning(f"⚠️ {len(result['failed_sections'])} part(s) could not be generated and were left as "
+                       f"placeholders: {', '.join(result['failed_sections'])}. Open **Revise** and click **Regenerate** "
+                       "to write them again — everything else is kept.")
+        else:
+            st.success("🎉 Your blog has been generated successfully!")
         
         # Stats in a nice card
         st.markdown("""
@@ -532,7 +698,43 @@ def main():
         with col3:
             st.metric("Status", "Complete", delta="Ready to use")
         
+        summary = run["summary"]
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Time", f"{summary['wall_s']:.1f} s")
+        with col2:
+            st.metric("Tokens", f"{summary['input_tokens'] + summary['output_tokens']:,}",
+                      delta=f"{summary['input_tokens']:,} in / {summary['output_tokens']:,} out", delta_color="off")
+        with col3:
+            st.metric("Est. cost", f"${summary['cost_usd']:.4f}")
+        
         st.markdown("</div></div>", unsafe_allow_html=True)
+        
+        with st.expander("⏱️ Per-node metrics", expanded=False):
+            # Nodes of a chapter are listed under it; the chapter's row already includes them
+            st.table([
+                {"Node": node, "Runs": row["runs"], "Wall (s)": round(row["wall_s"], 2),
+                 "Slowest (s)": round(row["max_wall_s"], 2), "Max queue (s)": round(row["max_queue_s"], 2),
+                 "LLM calls": row["llm_calls"], "Cached": row["cached_calls"], "Input tokens": row["input_tokens"],
+                 "Output tokens": row["output_tokens"], "Est. cost ($)": round(row["cost_usd"], 5)}
+                for name, entry in summary["nodes"].items()
+                for node, row in [(name, entry), *((f"  ↳ {child}", row) for child, row in entry.get("nodes", {}).items())]
+            ])
+            st.caption("Individual node runs (each section worker separately)")
+            st.table(run["node_rows"])
+    elif st.session_state.get("opened_report") and history is not None:
+        render_saved_report(history, st.session_state["opened_report"])
+    
+    # Script overhead per rerun; runs that generated a report are not counted
+    elapsed = time.perf_counter() - rerun_start
+    stats = perf_stats()
+    if stats["first_render"] is None:
+        stats["first_render"] = elapsed
+    elif not generate_button:
+        stats["reruns"].append(elapsed)
+    if loader and loader.done() and stats["pipeline_load"] is None:
+        stats["pipeline_load"] = loader.result()[1]
+    render_perf(perf_box)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,163 @@
+import os
+import re
+import csv
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+
+from pipeline import graph, run_sync, run_config, prepare_run, finish_run, flights, flight_key
+from metrics import RunMetrics, export
+from settings import SECTION_CONCURRENCY, EDIT_MODE, TOPIC_REUSE, SECTION_BATCHING, REPORT_MODE
+
+# Headless runner: generate reports for every topic in a JSONL/CSV file with a pool
+# of concurrent graph runs, e.g.
+#   python batch.py topics.jsonl --out reports --concurrency 4
+# Each report is written to <out>/<job id>.json as soon as it completes. Jobs that
+# already have an output file are skipped, and a job interrupted mid-run resumes
+# from its checkpoint (its thread id is derived from the job id). Jobs with the same
+# topic under different ids share one run while it is in progress.
+
+def job_id(row):
+    if row.get("id"):
+        return re.sub(r"[^\w.-]+", "_", str(row["id"]))
+    slug = re.sub(r"[^\w]+", "_", row["topic"].lower()).strip("_")[:60]
+    return f"{slug}-{hashlib.sha1(row['topic'].encode('utf-8')).hexdigest()[:8]}"
+
+def read_rows(f, path):
+    # (line number, row) pairs; a JSONL line that isn't valid JSON comes back as its error
+    if path.endswith(".csv"):
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(f, start=1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield number, exc
+
+def read_jobs(path):
+    # Returns (jobs, skipped): rows without a usable topic are listed in skipped as
+    # (line number, reason) instead of stopping the batch. Numeric topics are taken as text
+    jobs, skipped = [], []
+    with open(path, newline="", encoding="utf-8") as f:
+        for number, row in read_rows(f, path):
+            if isinstance(row, Exception):
+                skipped.append((number, f"invalid JSON ({row.msg})"))
+                continue
+            if not isinstance(row, dict):
+                skipped.append((number, "not a JSON object"))
+                continue
+            topic = row.get("topic")
+            if isinstance(topic, (int, float)) and not isinstance(topic, bool):
+                topic = str(topic)
+            if not isinstance(topic, str):
+                skipped.append((number, "no topic" if topic is None else f"topic is not text: {topic!r}"))
+            elif not topic.strip():
+                skipped.append((number, "empty topic"))
+            else:
+                row = {**row, "topic": topic.strip()}
+                jobs.append({"id": job_id(row), "topic": row["topic"]})
+    return jobs, skipped
+
+def write_report(out_dir, job, result, seconds, metrics):
+    record = {
+        "id": job["id"],
+        "topic": job["topic"],
+        "outline": [s.model_dump() for s in result["section"]],
+        "report": result["report"],
+        "final": result["final"],
+        "reused_from": result.get("reused_from"),
+        "seconds": round(seconds, 2),
+        "metrics": metrics.summary(),
+    }
+    path = os.path.join(out_dir, f"{job['id']}.json")
+    # Write-then-rename so a killed run never leaves a truncated file that would be skipped
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+async def run_job(job, section_concurrency, edit, reuse=None, batching=None, mode=None):
+    metrics = RunMetrics()
+    # Resumed only by a run with the same edit mode and report mode
+    config = run_config(section_concurrency, f"batch-{job['id']}-{edit}-{mode or REPORT_MODE}", edit, [metrics], reuse=reuse,
+                        batching=batching, mode=mode)
+
+    async def start(flight):
+        graph_input, _ = await prepare_run(job["topic"], config)
+        try:
+            result = await graph.ainvoke(graph_input, config)
+        finally:
+            export(metrics)
+        await finish_run(config, metrics.summary())
+        return result, metrics
+
+    flight, _ = await flights.join(flight_key(job["topic"], config), start)
+    return await flight.wait()
+
+async def run_batch(jobs, out_dir, concurrency, section_concurrency, edit, reuse=None, batching=None, mode=None):
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    stats = {"done": 0, "failed": 0}
+    started = time.perf_counter()
+
+    async def worker():
+        while not queue.empty():
+            job = queue.get_nowait()
+            job_start = time.perf_counter()
+            try:
+                result, metrics = await run_job(job, section_concurrency, edit, reuse, batching, mode)
+            except Exception as exc:
+                stats["failed"] += 1
+                print(f"[FAILED] {job['id']}: {exc!r}", flush=True)
+                continue
+            seconds = time.perf_counter() - job_start
+            write_report(out_dir, job, result, seconds, metrics)
+            stats["done"] += 1
+            elapsed = time.perf_counter() - started
+            print(f"[{stats['done'] + stats['failed']}/{len(jobs)}] {job['id']} "
+                  f"({len(result['section'])} sections, {seconds:.1f}s, ${metrics.summary()['cost_usd']:.4f}) | "
+                  f"{stats['done'] / elapsed * 60:.2f} reports/min", flush=True)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate reports for every topic in a JSONL or CSV file")
+    parser.add_argument("topics", help="JSONL file with a 'topic' (and optional 'id') per line, or a CSV with those columns")
+    parser.add_argument("--out", default="reports", help="Directory that receives one JSON file per report")
+    parser.add_argument("--concurrency", type=int, default=4, help="Reports generated at the same time")
+    parser.add_argument("--section-concurrency", type=int, default=SECTION_CONCURRENCY,
+                        help="Section writers running at once within each report")
+    parser.add_argument("--edit-mode", choices=["single", "mapreduce"], default=EDIT_MODE,
+                        help="One editor pass over the whole report, or per-section polishing plus a transition pass")
+    parser.add_argument("--reuse", choices=["off", "outline", "sections"], default=TOPIC_REUSE,
+                        help="What to take from the most similar topic generated before")
+    parser.add_argument("--batching", choices=["off", "auto"], default=SECTION_BATCHING,
+                        help="Write several sections per model call when the outline and rate limits allow it")
+    parser.add_argument("--report-mode", choices=["blog", "long"], default=REPORT_MODE,
+                        help="A blog, or a long report planned as chapters of sub-sections")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    jobs, skipped = read_jobs(args.topics)
+    for number, reason in skipped:
+        print(f"Skipping line {number} of {args.topics}: {reason}", flush=True)
+    jobs = list({job["id"]: job for job in jobs}.values())
+    pending = [job for job in jobs if not os.path.exists(os.path.join(args.out, f"{job['id']}.json"))]
+    print(f"{len(jobs)} jobs, {len(jobs) - len(pending)} already done, {len(pending)} to run", flush=True)
+    if not pending:
+        return
+
+    stats = run_sync(run_batch(pending, args.out, args.concurrency, args.section_concurrency, args.edit_mode, args.reuse,
+                               args.batching, args.report_mode))
+    print(f"Finished {stats['done']} reports ({stats['failed']} failed) in {stats['seconds']:.1f}s "
+          f"— {stats['done'] / stats['seconds'] * 60:.2f} reports/min", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import os
+import io
+import json
+import time
+import pickle
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+
+# Benchmarks always run offline against the fake model (fake_llm.py), with the LLM
+# response cache, topic index and report history off and checkpoints in a throwaway file, so every
+# run measures the orchestration of get_sections -> assign_worker ->
+# each_section_output -> report -> final plus whatever latency the fake model is
+# told to simulate.
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["LLM_CACHE"] = "0"
+os.environ["TOPIC_INDEX"] = "0"
+os.environ["HISTORY"] = "0"
+os.environ["CHECKPOINT_PATH"] = os.path.join(tempfile.mkdtemp(prefix="report-bench-"), "checkpoints.sqlite")
+os.environ["PDF_CACHE_DIR"] = tempfile.mkdtemp(prefix="report-bench-pdf-")
+
+import batch
+import pdf_export
+from metrics import RunMetrics
+from pipeline import graph, models, run_sync, iter_sync, run_config, finish_run
+from settings import EDIT_MODE, SECTION_CONCURRENCY
+
+TOPIC = "Benchmarking a LangGraph report pipeline"
+
+def configure(**fields):
+    # Every routed model (outline / section / editor) is a FakeChatModel here
+    for fake in models.values():
+        for name, value in fields.items():
+            setattr(fake, name, value)
+
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {"n": 0}
+    return {
+        "n": len(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        "max": samples[-1],
+    }
+
+async def one_run(edit, concurrency=None, topic=TOPIC):
+    config = run_config(concurrency, edit=edit)
+    start = time.perf_counter()
+    try:
+        result = await graph.ainvoke({"topic": topic}, config)
+    finally:
+        await finish_run(config)
+    return time.perf_counter() - start, result
+
+def sync_stream_run(edit):
+    # The path the Streamlit UI takes: astream driven from a plain thread via iter_sync
+    config = run_config(edit=edit)
+    start = time.perf_counter()
+    try:
+        for _ in iter_sync(graph.astream({"topic": TOPIC}, config, stream_mode=["updates", "messages"])):
+            pass
+    finally:
+        run_sync(finish_run(config))
+    return time.perf_counter() - start
+
+### Benchmarks
+def bench_latency(runs, edit):
+    modes = {"async": lambda: run_sync(one_run(edit))[0], "sync_stream": lambda: sync_stream_run(edit)}
+    report = {}
+    for name, run in modes.items():
+        samples, errors = [], 0
+        for _ in range(runs):
+            try:
+                samples.append(run())
+            except Exception:
+                errors += 1
+        report[name] = {**summarize(samples), "errors": errors}
+    return report
+
+def bench_fanout(counts, edit):
+    rows = []
+    default = models["outline"].sections
+    try:
+        for n in counts:
+            configure(sections=n)
+            try:
+                seconds, result = run_sync(one_run(edit, concurrency=n))
+            except Exception as exc:
+                rows.append({"sections": n, "seconds": None, "error": repr(exc)})
+                continue
+            rows.append({"sections": len(result["section"]), "seconds": seconds})
+    finally:
+        configure(sections=default)
+    return rows
+
+def bench_memory(edit):
+    # Injected failures are switched off here: this measures a complete run's state
+    error_rate = models["outline"].error_rate
+    configure(error_rate=0.0)
+    tracemalloc.start()
+    try:
+        seconds, result = run_sync(one_run(edit))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        configure(error_rate=error_rate)
+    return {"state_bytes": len(pickle.dumps(result)), "peak_traced_bytes": peak,
+            "sections": len(result["section"]), "final_chars": len(result["final"])}
+
+def bench_batching(edit):
+    # Section writes with one call per section vs. adaptive batching (SECTION_BATCHING)
+    error_rate = models["outline"].error_rate
+    configure(error_rate=0.0)
+    rows = {}
+    try:
+        for batching in ("off", "auto"):
+            metrics = RunMetrics()
+            config = run_config(edit=edit, callbacks=[metrics], batching=batching)
+            start = time.perf_counter()
+            try:
+                result = run_sync(graph.ainvoke({"topic": TOPIC}, config))
+            finally:
+                run_sync(finish_run(config))
+            writers = metrics.summary()["nodes"]["each_section_output"]
+            rows[batching] = {"seconds": time.perf_counter() - start, "sections": len(result["complete_sections"]),
+                              "workers": writers["runs"], "llm_calls": writers["llm_calls"],
+                              "input_tokens": writers["input_tokens"]}
+    finally:
+        configure(error_rate=error_rate)
+    return rows
+
+def bench_long(sizes, edit):
+    # A long report with k chapters of k sub-sections each, against a flat outline with
+    # the same k*k sections: wall time, peak traced memory and the largest single prompt
+    error_rate, default = models["outline"].error_rate, models["outline"].sections
+    rows = []
+    try:
+        for k in sizes:
+            for mode in ("long", "blog"):
+                configure(error_rate=0.0, sections=k if mode == "long" else k * k)
+                metrics = RunMetrics()
+                config = run_config(edit=edit, callbacks=[metrics], mode=mode)
+                tracemalloc.start()
+                start = time.perf_counter()
+                try:
+                    result = run_sync(graph.ainvoke({"topic": TOPIC}, config))
+                    seconds = time.perf_counter() - start
+                    _, peak = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+                    run_sync(finish_run(config))
+                rows.append({"mode": mode, "sections": k * k, "seconds": seconds, "peak_traced_bytes": peak,
+                             "max_prompt_tokens": max(call["input_tokens"] for call in metrics.calls),
+                             "final_chars": len(result["final"])})
+    finally:
+        configure(error_rate=error_rate, sections=default)
+    return rows
+
+def bench_throughput(levels, edit):
+    async def burst(n):
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(one_run(edit, topic=f"{TOPIC} #{i}") for i in range(n)), return_exceptions=True)
+        seconds = time.perf_counter() - start
+        errors = sum(isinstance(outcome, BaseException) for outcome in outcomes)
+        return {"concurrent_runs": n, "seconds": seconds, "runs_per_s": (n - errors) / seconds, "errors": errors}
+    return [run_sync(burst(n)) for n in levels]
+
+def bench_batch(jobs, concurrency, edit):
+    out_dir = tempfile.mkdtemp(prefix="report-bench-batch-")
+    pending = [{"id": f"job-{i}", "topic": f"{TOPIC} #{i}"} for i in range(jobs)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = run_sync(batch.run_batch(pending, out_dir, concurrency, SECTION_CONCURRENCY, edit))
+    return {**stats, "jobs": jobs, "concurrency": concurrency, "runs_per_s": stats["done"] / stats["seconds"]}
+
+def pdf_report(pages):
+    # Fake sections with a list and a table each, about 450 words per A4 page
+    fake = models["section"]
+    parts, words = [], 0
+    while words < pages * 450:
+        text = fake._markdown()
+        parts.append(text + "\n\n" + "\n".join(f"- {fake._text(8)}" for _ in range(4))
+                     + "\n\n| Metric | Value | Note |\n|---|---|---|\n"
+                     + "\n".join(f"| {fake._text(2)} | {i} | {fake._text(6)} |" for i in range(5)))
+        words += len(text.split()) + 80
+    return "\n\n".join(parts)
+
+def bench_pdf(pages):
+    markdown = pdf_report(pages)
+    rows = {}
+    # Warm-up: fonts and ReportLab's caches are loaded on the first render
+    pdf_export.render_pdf(pdf_report(1), TOPIC, os.path.join(pdf_export.PDF_CACHE_DIR, "bench-warmup.pdf"))
+    for mode, incremental in (("incremental", True), ("full_list", False)):
+        path = os.path.join(pdf_export.PDF_CACHE_DIR, f"bench-{mode}.pdf")
+        tracemalloc.start()
+        try:
+            stats = pdf_export.render_pdf(markdown, TOPIC, path, incremental=incremental)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        rows[mode] = {**stats, "peak_traced_bytes": peak}
+    # Background export: the first call renders, a repeat download is served from the cache
+    for name in ("export_first", "export_cached"):
+        start = time.perf_counter()
+        pdf_export.pdf_bytes(markdown, TOPIC)
+        rows[name] = {"seconds": time.perf_counter() - start}
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the report graph (fake model)")
+    parser.add_argument("--runs", type=int, default=5, help="Sequential runs per mode for the latency benchmark")
+    parser.add_argument("--latency", default="fixed:0", help="Fake model latency, e.g. fixed:0.5 or lognormal:-0.7,0.4")
+    parser.add_argument("--words", type=int, default=200, help="Average words per fake section/edit response")
+    parser.add_argument("--sections", type=int, default=6, help="Sections in the fake outline")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability that a fake model call raises")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fanout", type=int, nargs="*", default=[2, 4, 8, 16, 32], help="Section counts to scale over")
+    parser.add_argument("--concurrent", type=int, nargs="*", default=[1, 4, 16], help="Concurrent runs for throughput")
+    parser.add_argument("--batch-jobs", type=int, default=16)
+    parser.add_argument("--batch-concurrency", type=int, default=4)
+    parser.add_argument("--long", type=int, nargs="*", default=[4, 6, 8, 10],
+                        help="Chapters (= sub-sections per chapter) for the long-report benchmark")
+    parser.add_argument("--pdf-pages", type=int, default=50, help="Approximate length of the PDF export benchmark report")
+    parser.add_argument("--edit-mode", choices=["single", "mapreduce"], default=EDIT_MODE)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    configure(latency=args.latency, words=args.words, sections=args.sections,
+              error_rate=args.error_rate, seed=args.seed, _rng=None)
+
+    results = {"settings": vars(args)}
+    print(f"Fake model: latency={args.latency} words={args.words} sections={args.sections} "
+          f"error_rate={args.error_rate} edit_mode={args.edit_mode}\n")
+
+    results["latency"] = bench_latency(args.runs, args.edit_mode)
+    print("End-to-end latency (s)")
+    for name, row in results["latency"].items():
+        if row["n"]:
+            print(f"  {name:12} mean {row['mean']:.3f}  p50 {row['p50']:.3f}  p95 {row['p95']:.3f}  "
+                  f"max {row['max']:.3f}  errors {row['errors']}")
+        else:
+            print(f"  {name:12} all {row['errors']} runs failed")
+
+    results["fanout"] = bench_fanout(args.fanout, args.edit_mode)
+    print("\nFan-out scaling (section concurrency = section count)")
+    for row in results["fanout"]:
+        if row["seconds"] is None:
+            print(f"  {row['sections']:>4} sections  failed: {row['error']}")
+        else:
+            print(f"  {row['sections']:>4} sections  {row['seconds']:.3f} s")
+
+    results["memory"] = bench_memory(args.edit_mode)
+    row = results["memory"]
+    print(f"\nState memory: {row['state_bytes'] / 1024:.1f} KiB pickled final state, "
+          f"{row['peak_traced_bytes'] / 1024:.1f} KiB peak traced during the run")
+
+    results["batching"] = bench_batching(args.edit_mode)
+    print("\nSection batching (section workers, their model calls and prompt tokens)")
+    for name, row in results["batching"].items():
+        print(f"  {name:5} {row['sections']} sections  {row['workers']} workers  {row['llm_calls']} calls  "
+              f"{row['input_tokens']} prompt tokens  {row['seconds']:.3f} s")
+
+    results["long"] = bench_long(args.long, args.edit_mode)
+    print("\nLong reports (chapters x sub-sections) vs. the same sections in one flat outline")
+    for row in results["long"]:
+        print(f"  {row['mode']:5} {row['sections']:>4} sections  {row['seconds']:.3f} s  "
+              f"{row['peak_traced_bytes'] / 1024:.1f} KiB peak traced  largest prompt {row['max_prompt_tokens']} tokens")
+
+    results["throughput"] = bench_throughput(args.concurrent, args.edit_mode)
+    print("\nThroughput (concurrent runs on one event loop)")
+    for row in results["throughput"]:
+        print(f"  {row['concurrent_runs']:>4} runs  {row['seconds']:.3f} s  {row['runs_per_s']:.2f} runs/s  "
+              f"errors {row['errors']}")
+
+    results["batch"] = bench_batch(args.batch_jobs, args.batch_concurrency, args.edit_mode)
+    row = results["batch"]
+    print(f"\nBatch mode: {row['done']}/{row['jobs']} jobs at concurrency {row['concurrency']} in "
+          f"{row['seconds']:.3f} s ({row['runs_per_s']:.2f} runs/s, {row['failed']} failed)")
+
+    results["pdf"] = bench_pdf(args.pdf_pages)
+    print("\nPDF export")
+    for mode in ("incremental", "full_list"):
+        row = results["pdf"][mode]
+        print(f"  {mode:12} {row['pages']} pages  {row['seconds']:.3f} s  "
+              f"{row['peak_traced_bytes'] / 1024:.1f} KiB peak traced  {row['bytes'] / 1024:.1f} KiB file")
+    print(f"  export       {results['pdf']['export_first']['seconds']:.3f} s first, "
+          f"{results['pdf']['export_cached']['seconds'] * 1000:.2f} ms cached")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import contextlib
+import contextvars
+from collections import OrderedDict
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from settings import CACHE_ENABLED, CACHE_PATH, CACHE_TTL, CACHE_MAX_MB, CACHE_MEMORY_ITEMS
+
+# Keys stored by the model call running in the current task (see forget)
+_written = contextvars.ContextVar("llm_cache_written", default=None)
+# Set while calls must ask the model again (see bypass)
+_bypassed = contextvars.ContextVar("llm_cache_bypassed", default=False)
+
+### Cache
+# LangChain hands every chat model call to the cache as (prompt, llm_string):
+# prompt is the serialized system + human messages, llm_string holds the model
+# name, generation parameters and any bound tools (the structured outline schema).
+# Both go into a content-addressed key, so a changed prompt or setting is a miss.
+#
+# The size of the disk tier is kept as a running total instead of being summed
+# on every write. Other processes write to the same file, so the total is read
+# again from the table every RESYNC_EVERY writes and before evicting, which
+# drops rows down to EVICT_TO of the cap so the next eviction is a while off.
+RESYNC_EVERY = 256
+EVICT_TO = 0.9
+
+class TieredLLMCache(BaseCache):
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_mb=CACHE_MAX_MB, memory_items=CACHE_MEMORY_ITEMS):
+        self.ttl = ttl
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._db.commit()
+        self._writes = 0
+        self._size = self._total()
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, created, generations):
+        self._memory[key] = (created, generations)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def lookup(self, prompt, llm_string):
+        if _bypassed.get():
+            self.misses += 1
+            return None
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            # Tier 1: in-process LRU
+            entry = self._memory.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return entry[1]
+            self._memory.pop(key, None)
+
+            # Tier 2: SQLite, shared by every process on the machine
+            row = self._db.execute("SELECT value, created, size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                if row is not None:
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._size -= row[2]
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            generations = loads(row[0])
+            self._remember(key, row[1], generations)
+            self.hits["disk"] += 1
+            return generations
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._key(prompt, llm_string)
+        written = _written.get()
+        if written is not None:
+            written.append(key)
+        value = dumps(list(return_val))
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, list(return_val))
+            self._size += len(value) - self._stored_size(key)
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._writes += 1
+            if self._writes % RESYNC_EVERY == 0 or self._size > self.max_bytes:
+                self._evict(now)
+            self._db.commit()
+
+    def _total(self):
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def _stored_size(self, key):
+        row = self._db.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM llm_cache WHERE created <= ?", (now - self.ttl,))
+        self._size = self._total()
+        if self._size <= self.max_bytes:
+            return
+        # Drop least recently used rows until the table is back under EVICT_TO of the cap
+        for key, size in self._db.execute("SELECT key, size FROM llm_cache ORDER BY accessed ASC").fetchall():
+            if self._size <= self.max_bytes * EVICT_TO:
+                break
+            self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            self._size -= size
+
+    @contextlib.contextmanager
+    def track_writes(self):
+        # Collects the keys stored while the block runs, for forget()
+        token = _written.set([])
+        try:
+            yield _written.get()
+        finally:
+            _written.reset(token)
+
+    @contextlib.contextmanager
+    def bypass(self):
+        # Calls made while the block runs are never served from the cache; their
+        # replies still replace the cached ones
+        token = _bypassed.set(True)
+        try:
+            yield
+        finally:
+            _bypassed.reset(token)
+
+    def forget(self, keys):
+        # Drops replies that turned out to be unusable (a malformed tool call, an empty
+        # text), so retrying the same prompt asks the model again instead of replaying them
+        with self._lock:
+            for key in keys:
+                self._memory.pop(key, None)
+                self._size -= self._stored_size(key)
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._db.commit()
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM llm_cache")
+            self._db.commit()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        lookups = self.hits["memory"] + self.hits["disk"] + self.misses
+        return {
+            "memory_hits": self.hits["memory"],
+            "disk_hits": self.hits["disk"],
+            "misses": self.misses,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": entries,
+            "disk_mb": round(size / (1024 * 1024), 2),
+        }
+
+llm_cache = TieredLLMCache() if CACHE_ENABLED else None
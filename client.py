@@ -0,0 +1,71 @@
+import json
+import time
+
+import httpx
+
+from settings import GENERATION_SERVICE_URL
+
+# Thin HTTP client for the generation service (service.py), used by the Streamlit app
+# when GENERATION_SERVICE_URL is set.
+
+def submit_job(topic, edit_mode, concurrency, session_id=None, thread_id=None, reuse=None, revision=None):
+    # Returns (job id, attached): attached when the same report was already queued or
+    # running, and that job is returned instead of a new one
+    response = httpx.post(f"{GENERATION_SERVICE_URL}/jobs", timeout=10, json={
+        "topic": topic, "edit_mode": edit_mode, "concurrency": concurrency,
+        "session_id": session_id, "thread_id": thread_id, "reuse": reuse, "revision": revision,
+    })
+    response.raise_for_status()
+    job = response.json()
+    return job["id"], job.get("attached", False)
+
+def job_status(job_id):
+    response = httpx.get(f"{GENERATION_SERVICE_URL}/jobs/{job_id}", timeout=10)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+def job_result(job_id):
+    response = httpx.get(f"{GENERATION_SERVICE_URL}/jobs/{job_id}/result", timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+def service_health():
+    try:
+        response = httpx.get(f"{GENERATION_SERVICE_URL}/health", timeout=2)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return None
+    return response.json()
+
+def job_events(job_id, retries=5):
+    # Yields {"seq", "type", "data"} until the job's done/error event. A dropped
+    # connection is reopened after the last event seen, so nothing is lost or repeated.
+    last, failures = 0, 0
+    while True:
+        try:
+            with httpx.stream("GET", f"{GENERATION_SERVICE_URL}/jobs/{job_id}/events", params={"after": last},
+                              timeout=httpx.Timeout(10, read=60)) as response:
+                response.raise_for_status()
+                event = {}
+                for line in response.iter_lines():
+                    if line.startswith("id:"):
+                        event["seq"] = int(line[3:])
+                    elif line.startswith("event:"):
+                        event["type"] = line[6:].strip()
+                    elif line.startswith("data:"):
+                        event["data"] = json.loads(line[5:])
+                    elif not line and "type" in event:
+                        last, failures = event["seq"], 0
+                        yield event
+                        if event["type"] in ("done", "error"):
+                            return
+                        event = {}
+        except httpx.TransportError:
+            pass
+        # The stream ended early (service restart, dropped connection): back off and reconnect
+        failures += 1
+        if failures > retries:
+            raise ConnectionError(f"lost the event stream of job {job_id}")
+        time.sleep(min(2 ** failures, 10))
@@ -0,0 +1,138 @@
+import time
+import uuid
+import random
+import asyncio
+from typing import Optional
+
+from pydantic import PrivateAttr
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Offline stand-in for ChatGroq. It answers plain calls with lorem-style Markdown
+# and structured-output calls (with_structured_output -> bound tool) with a tool
+# call whose arguments are generated from the tool's JSON schema, so the outline
+# schema and any other pydantic schema work without a network round trip.
+#
+# Latency is a distribution spec:
+#   "fixed:0.5"  "uniform:0.2,1.5"  "normal:0.8,0.2"  "lognormal:-0.5,0.4"  "exp:0.7"
+
+WORDS = ("model data system latency graph section report token request cache stream "
+         "worker queue throughput scaling memory batch pipeline editor outline").split()
+
+class FakeLLMError(RuntimeError):
+    pass
+
+class FakeChatModel(BaseChatModel):
+    model_name: str = "fake-chat"
+    latency: str = "fixed:0"
+    words: int = 200
+    sections: int = 6
+    error_rate: float = 0.0
+    # Requests slower than this (seconds) are cut off with a TimeoutError, as the Groq client would
+    timeout: Optional[float] = None
+    seed: Optional[int] = None
+    # String fields of a structured reply that get Markdown (a heading and paragraphs)
+    # instead of a short phrase, e.g. the sections written by a batched section call
+    markdown_fields: tuple[str, ...] = ("content",)
+    _rng: Optional[random.Random] = PrivateAttr(default=None)
+
+    @property
+    def rng(self):
+        if self._rng is None:
+            self._rng = random.Random(self.seed)
+        return self._rng
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name, "words": self.words, "sections": self.sections}
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], tool_choice=tool_choice, **kwargs)
+
+    ### Sampling
+    def sample_latency(self):
+        kind, _, args = self.latency.partition(":")
+        params = [float(x) for x in args.split(",") if x]
+        if kind == "fixed":
+            return params[0] if params else 0.0
+        if kind == "uniform":
+            return self.rng.uniform(*params)
+        if kind == "normal":
+            return max(0.0, self.rng.gauss(*params))
+        if kind == "lognormal":
+            return self.rng.lognormvariate(*params)
+        if kind == "exp":
+            return self.rng.expovariate(1 / params[0])
+        raise ValueError(f"Unknown latency distribution: {self.latency}")
+
+    def _text(self, n_words):
+        return " ".join(self.rng.choice(WORDS) for _ in range(max(1, n_words)))
+
+    def _markdown(self):
+        n_words = int(self.words * self.rng.uniform(0.8, 1.2))
+        paragraphs = [self._text(60) + "." for _ in range(max(1, n_words // 60))]
+        return f"## {self._text(4).title()}\n\n" + "\n\n".join(paragraphs)
+
+    def _fake_value(self, schema, defs, name=None):
+        if "$ref" in schema:
+            return self._fake_value(defs[schema["$ref"].split("/")[-1]], defs, name)
+        kind = schema.get("type")
+        if kind == "object":
+            return {key: self._fake_value(prop, defs, key) for key, prop in schema.get("properties", {}).items()}
+        if kind == "array":
+            count = min(max(self.sections, schema.get("minItems", 0)), schema.get("maxItems", self.sections))
+            return [self._fake_value(schema.get("items", {}), defs) for _ in range(count)]
+        if kind == "integer":
+            return self.rng.randint(1, 10)
+        if kind == "number":
+            return self.rng.random()
+        if kind == "boolean":
+            return True
+        if name in self.markdown_fields:
+            return self._markdown()
+        return self._text(12)
+
+    def _reply(self, messages, tools=None, **kwargs):
+        if self.rng.random() < self.error_rate:
+            raise FakeLLMError("fake model: injected failure")
+        prompt_tokens = sum(len(str(m.content).split()) for m in messages) * 4 // 3
+        if tools:
+            function = tools[0]["function"]
+            params = function.get("parameters", {})
+            args = self._fake_value(params, params.get("$defs", {}))
+            message = AIMessage(content="", tool_calls=[{"name": function["name"], "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"}])
+            completion_tokens = len(str(args).split()) * 4 // 3
+        else:
+            message = AIMessage(content=self._markdown())
+            completion_tokens = len(message.content.split()) * 4 // 3
+        message.usage_metadata = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                                  "total_tokens": prompt_tokens + completion_tokens}
+        message.response_metadata = {"model_name": self.model_name}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _wait(self):
+        # How long to sleep, and whether the request is cut off by the timeout after that
+        latency = self.sample_latency()
+        if self.timeout is not None and latency > self.timeout:
+            return self.timeout, True
+        return latency, False
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, timed_out = self._wait()
+        time.sleep(delay)
+        if timed_out:
+            raise TimeoutError(f"fake model: no reply within {self.timeout}s")
+        return self._reply(messages, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, timed_out = self._wait()
+        await asyncio.sleep(delay)
+        if timed_out:
+            raise TimeoutError(f"fake model: no reply within {self.timeout}s")
+        return self._reply(messages, **kwargs)
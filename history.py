@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from settings import HISTORY_ENABLED, HISTORY_PATH, HISTORY_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Report history: every finished run (app, batch or service worker) is stored with its
+# outline, draft, final text and metrics, so it can be found and reopened later.
+#
+# `reports` holds the small per-report row the sidebar lists; the texts live in
+# `report_bodies` and are only read when a report is opened. `reports_fts` is an FTS5
+# index over topic and final text, backed by the `report_documents` view (external
+# content), so the text is not stored twice.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, created REAL NOT NULL, mode TEXT, edit_mode TEXT,
+    sections INTEGER NOT NULL, words INTEGER NOT NULL, outline TEXT NOT NULL, metrics TEXT);
+CREATE TABLE IF NOT EXISTS report_bodies (
+    id INTEGER PRIMARY KEY REFERENCES reports(id) ON DELETE CASCADE, report TEXT NOT NULL, final TEXT NOT NULL,
+    drafts TEXT NOT NULL, edited TEXT NOT NULL, final_sections TEXT NOT NULL);
+CREATE VIEW IF NOT EXISTS report_documents AS
+    SELECT reports.id AS id, reports.topic AS topic, report_bodies.final AS final
+    FROM reports JOIN report_bodies ON report_bodies.id = reports.id;
+CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5(
+    topic, final, content='report_documents', content_rowid='id', tokenize='porter unicode61');
+"""
+
+LISTED = "reports.id, reports.topic, reports.created, reports.mode, reports.sections, reports.words"
+
+def match_query(text):
+    # User input as an FTS5 query: every word must match, the last one as a prefix
+    # (search-as-you-type); quoting keeps FTS5 operators and punctuation literal
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    return " ".join(terms) + "*" if terms else ""
+
+class ReportHistory:
+    def __init__(self, path=HISTORY_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    ### Record
+    def add(self, topic, outline, final, report="", drafts=(), edited=(), final_sections=(), mode=None,
+            edit_mode=None, metrics=None):
+        with self._lock, self.conn:
+            report_id = self.conn.execute(
+                "INSERT INTO reports (topic, created, mode, edit_mode, sections, words, outline, metrics) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (topic, time.time(), mode, edit_mode, len(outline), len(final.split()), json.dumps(outline),
+                 json.dumps(metrics) if metrics else None)).lastrowid
+            self.conn.execute(
+                "INSERT INTO report_bodies (id, report, final, drafts, edited, final_sections) VALUES (?, ?, ?, ?, ?, ?)",
+                (report_id, report, final, json.dumps(list(drafts)), json.dumps(list(edited)),
+                 json.dumps(list(final_sections))))
+            self.conn.execute("INSERT INTO reports_fts (rowid, topic, final) VALUES (?, ?, ?)", (report_id, topic, final))
+        return report_id
+
+    def delete(self, report_id):
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT topic, final FROM report_documents WHERE id = ?", (report_id,)).fetchone()
+            if row is None:
+                return
+            # External-content index: the old values have to be handed back to remove them
+            self.conn.execute("INSERT INTO reports_fts (reports_fts, rowid, topic, final) VALUES ('delete', ?, ?, ?)",
+                              (report_id, row["topic"], row["final"]))
+            self.conn.execute("DELETE FROM reports WHERE id = ?", (report_id,))
+
+    ### Browse
+    def page(self, cursor=None, limit=HISTORY_PAGE_SIZE):
+        # Newest first. Keyset pagination: cursor is the last id of the previous page,
+        # so every page costs the same however far back it is. Returns (rows, next cursor)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {LISTED} FROM reports WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (cursor if cursor is not None else 2 ** 63 - 1, limit + 1)).fetchall()
+        rows = [dict(row) for row in rows]
+        return rows[:limit], rows[limit - 1]["id"] if len(rows) > limit else None
+
+    def search(self, text, cursor=None, limit=HISTORY_PAGE_SIZE):
+        # Best matches first (bm25), with a highlighted excerpt of the final text.
+        # cursor is the number of results already shown. Returns (rows, next cursor)
+        query, offset = match_query(text), cursor or 0
+        if not query:
+            return [], None
+        with self._lock:
+            try:
+                rows = self.conn.execute(
+                    f"SELECT {LISTED}, snippet(reports_fts, 1, '**', '**', '…', 12) AS excerpt "
+                    "FROM reports_fts JOIN reports ON reports.id = reports_fts.rowid "
+                    "WHERE reports_fts MATCH ? ORDER BY bm25(reports_fts, 5.0, 1.0) LIMIT ? OFFSET ?",
+                    (query, limit + 1, offset)).fetchall()
+            except sqlite3.OperationalError:
+                logger.debug("unusable history search %r", text, exc_info=True)
+                return [], None
+        rows = [dict(row) for row in rows]
+        return rows[:limit], offset + limit if len(rows) > limit else None
+
+    def get(self, report_id):
+        # The whole report, bodies included
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT reports.*, report_bodies.report, report_bodies.final, report_bodies.drafts, "
+                "report_bodies.edited, report_bodies.final_sections "
+                "FROM reports JOIN report_bodies ON report_bodies.id = reports.id WHERE reports.id = ?",
+                (report_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        for key in ("outline", "drafts", "edited", "final_sections"):
+            record[key] = json.loads(record[key])
+        record["metrics"] = json.loads(record["metrics"]) if record["metrics"] else None
+        return record
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+_history = None
+_history_lock = threading.Lock()
+
+def get_history():
+    # Opened on first use; None when the history is disabled
+    global _history
+    with _history_lock:
+        if _history is None and HISTORY_ENABLED:
+            _history = ReportHistory()
+        return _history
@@ -0,0 +1,189 @@
+import json
+import time
+import logging
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from settings import MODEL_PRICES, OTEL_ENABLED
+
+logger = logging.getLogger(__name__)
+
+### Prices
+# Estimated USD per 1M tokens (input, output). Override or extend with the
+# MODEL_PRICES env var, e.g. MODEL_PRICES='{"openai/gpt-oss-120b": [0.15, 0.75]}'
+PRICES = {
+    "openai/gpt-oss-120b": (0.15, 0.75),
+    "openai/gpt-oss-20b": (0.10, 0.50),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+}
+PRICES.update({name: tuple(price) for name, price in json.loads(MODEL_PRICES or "{}").items()})
+
+def estimate_cost(model_name, input_tokens, output_tokens):
+    price_in, price_out = PRICES.get(model_name, (0.0, 0.0))
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+### Run metrics
+# Callback handler passed in the run config. LangGraph tags every callback with the
+# node (langgraph_node) and super-step (langgraph_step) it belongs to, so node
+# spans come from chain start/end events and token usage from the chat model's
+# usage_metadata. Queue time is the gap between the moment a node's super-step
+# became runnable (all earlier steps finished) and the node actually starting.
+# A subgraph (the chapter writer of long reports) counts its steps from 1 again,
+# so steps are only compared within one graph: spans are grouped by the parent
+# part of langgraph_checkpoint_ns, and a subgraph's first step becomes runnable
+# when the node running the subgraph starts.
+class RunMetrics(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.calls = []
+        self._open_spans = {}
+        self._open_calls = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            self._open_spans[run_id] = (node, metadata.get("langgraph_step", 0),
+                                        metadata.get("langgraph_checkpoint_ns", ""), time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._close_span(run_id, None)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._close_span(run_id, error)
+
+    def _close_span(self, run_id, error):
+        if run_id in self._open_spans:
+            node, step, ns, start = self._open_spans.pop(run_id)
+            self.spans.append({"node": node, "step": step, "ns": ns, "scope": ns.rpartition("|")[0], "start": start,
+                               "end": time.perf_counter(), "error": repr(error) if error else None})
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        metadata = metadata or {}
+        self._open_calls[run_id] = (metadata.get("langgraph_node"), _parent(metadata.get("langgraph_checkpoint_ns", "")),
+                                    time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        node, parent, start = self._open_calls.pop(run_id, (None, None, time.perf_counter()))
+        message = getattr(response.generations[0][0], "message", None) if response.generations else None
+        usage = getattr(message, "usage_metadata", None) or {}
+        model_name = (getattr(message, "response_metadata", None) or {}).get("model_name") \
+            or (response.llm_output or {}).get("model_name", "unknown")
+        # LangChain marks responses served from the LLM cache with total_cost = 0
+        cached = "total_cost" in usage
+        input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        self.calls.append({
+            "node": node, "parent": parent, "model": model_name, "seconds": time.perf_counter() - start, "cached": cached,
+            "input_tokens": input_tokens, "output_tokens": output_tokens,
+            "cost": 0.0 if cached else estimate_cost(model_name, input_tokens, output_tokens),
+        })
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._open_calls.pop(run_id, None)
+
+    def node_rows(self):
+        # One row per node execution; each section worker gets its own row. Nodes of a
+        # subgraph name the node that ran it as their parent
+        by_ns = {span["ns"]: span for span in self.spans}
+        rows = []
+        for span in sorted(self.spans, key=lambda s: s["start"]):
+            parent = by_ns.get(span["scope"])
+            earlier = [s["end"] for s in self.spans if s["scope"] == span["scope"] and s["step"] < span["step"]]
+            ready = max(earlier) if earlier else parent["start"] if parent else self.started
+            rows.append({"node": span["node"], "parent": parent["node"] if parent else None, "step": span["step"],
+                         "wall_s": round(span["end"] - span["start"], 3), "queue_s": round(max(0.0, span["start"] - ready), 3),
+                         "error": span["error"]})
+        return rows
+
+    def summary(self):
+        # Per node totals. Subgraph nodes are listed under the node that ran them
+        # ("nodes" of its entry): that node's wall time already covers them, and its
+        # LLM calls and tokens include theirs, so the top-level entries add up to the run
+        nodes = {}
+        for row in self.node_rows():
+            entry = _node_entry(nodes, row["parent"], row["node"])
+            entry["runs"] += 1
+            entry["wall_s"] += row["wall_s"]
+            entry["max_wall_s"] = max(entry["max_wall_s"], row["wall_s"])
+            entry["max_queue_s"] = max(entry["max_queue_s"], row["queue_s"])
+        for call in self.calls:
+            if call["node"] is None:
+                continue
+            entries = [_node_entry(nodes, call["parent"], call["node"])]
+            if call["parent"]:
+                entries.append(nodes[call["parent"]])
+            for entry in entries:
+                entry["llm_calls"] += 1
+                entry["cached_calls"] += call["cached"]
+                entry["input_tokens"] += call["input_tokens"]
+                entry["output_tokens"] += call["output_tokens"]
+                entry["cost_usd"] += call["cost"]
+        for entry in [*nodes.values(), *(child for entry in nodes.values() for child in entry.get("nodes", {}).values())]:
+            entry["wall_s"], entry["cost_usd"] = round(entry["wall_s"], 3), round(entry["cost_usd"], 6)
+        ends = [span["end"] for span in self.spans]
+        return {
+            "wall_s": round((max(ends) if ends else time.perf_counter()) - self.started, 3),
+            "input_tokens": sum(call["input_tokens"] for call in self.calls),
+            "output_tokens": sum(call["output_tokens"] for call in self.calls),
+            "cost_usd": round(sum(call["cost"] for call in self.calls), 6),
+            "nodes": nodes,
+        }
+
+def _parent(ns):
+    # Name of the node running the subgraph a checkpoint namespace belongs to
+    # ("write_chapter:<task>|plan_chapter:<task>" -> "write_chapter"), None at the top
+    scope = ns.rpartition("|")[0]
+    return scope.rpartition("|")[2].partition(":")[0] or None
+
+def _node_entry(nodes, parent, node):
+    if parent:
+        nodes = _node_entry(nodes, None, parent).setdefault("nodes", {})
+    return nodes.setdefault(node, {"runs": 0, "wall_s": 0.0, "max_wall_s": 0.0, "max_queue_s": 0.0, "llm_calls": 0,
+                                   "cached_calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+
+### OpenTelemetry export
+# Metrics go through the OpenTelemetry API. When OTEL_EXPORTER_OTLP_ENDPOINT is
+# set, an SDK MeterProvider with the OTLP/HTTP exporter is installed; otherwise
+# whatever provider the host process configured (or the no-op default) is used.
+_instruments = None
+
+def _get_instruments():
+    global _instruments
+    if _instruments is None:
+        from opentelemetry import metrics as otel_metrics
+        if OTEL_ENABLED:
+            from opentelemetry.sdk.metrics import MeterProvider
+            from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+            from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+            otel_metrics.set_meter_provider(MeterProvider(metric_readers=[PeriodicExportingMetricReader(OTLPMetricExporter())]))
+        meter = otel_metrics.get_meter("ai_report_generator")
+        _instruments = {
+            "run_duration": meter.create_histogram("report.run.duration", unit="s"),
+            "node_duration": meter.create_histogram("report.node.duration", unit="s"),
+            "node_queue": meter.create_histogram("report.node.queue_time", unit="s"),
+            "tokens": meter.create_counter("report.llm.tokens", unit="{token}"),
+            "cost": meter.create_counter("report.llm.cost", unit="USD"),
+        }
+    return _instruments
+
+def export(metrics):
+    try:
+        instruments = _get_instruments()
+    except ImportError:
+        logger.debug("opentelemetry is not installed; run metrics are not exported")
+        return
+    instruments["run_duration"].record(metrics.summary()["wall_s"])
+    for row in metrics.node_rows():
+        attributes = {"node": row["node"], "error": row["error"] is not None}
+        if row["parent"]:
+            attributes["parent"] = row["parent"]
+        instruments["node_duration"].record(row["wall_s"], attributes)
+        instruments["node_queue"].record(row["queue_s"], attributes)
+    for call in metrics.calls:
+        attributes = {"node": call["node"] or "unknown", "model": call["model"], "cached": call["cached"]}
+        instruments["tokens"].add(call["input_tokens"], {**attributes, "kind": "input"})
+        instruments["tokens"].add(call["output_tokens"], {**attributes, "kind": "output"})
+        instruments["cost"].add(call["cost"], attributes)
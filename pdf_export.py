@@ -0,0 +1,246 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+import concurrent.futures
+from xml.sax.saxutils import escape
+
+from settings import PDF_CACHE_DIR, PDF_CACHE_MAX_MB, PDF_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# PDF export of the final Markdown with ReportLab. Rendering runs on a small thread
+# pool so the Streamlit script never waits for it, and every PDF is cached on disk by
+# a hash of its content: downloading the same report again is a file read.
+#
+# Large reports are not turned into one big list of flowables first. The Markdown is
+# parsed lazily and ReportLab's build loop pulls one block at a time (see
+# _FlowableStream), so only the page being laid out is held as flowables.
+
+### Markdown -> flowables
+INLINE = [
+    (re.compile(r"`([^`]+)`"), r'<font face="Courier">\1</font>'),
+    (re.compile(r"\*\*(.+?)\*\*|__(.+?)__"), lambda m: f"<b>{m.group(1) or m.group(2)}</b>"),
+    (re.compile(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?!\*)"), r"<i>\1</i>"),
+    (re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)"), r'<link href="\2" color="#1D4ED8">\1</link>'),
+]
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+LIST_ITEM = re.compile(r"^(\s*)([-*+]|\d+[.)])\s+(.*)$")
+TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+
+def inline(text):
+    text = escape(text)
+    for pattern, replacement in INLINE:
+        text = pattern.sub(replacement, text)
+    return text
+
+def _styles():
+    from reportlab.lib.colors import HexColor
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle("Quote", parent=styles["BodyText"], leftIndent=18, textColor=HexColor("#475569"),
+                              fontName="Helvetica-Oblique"))
+    styles.add(ParagraphStyle("Cell", parent=styles["BodyText"], fontSize=9, leading=11))
+    for depth in range(4):
+        styles.add(ParagraphStyle(f"Bullet{depth}", parent=styles["BodyText"], leftIndent=14 + 14 * depth,
+                                  bulletIndent=14 * depth))
+    styles["Code"].fontSize = 8
+    styles["Code"].leading = 10
+    return styles
+
+def _paragraph(text, style, **kwargs):
+    from reportlab.platypus import Paragraph
+    try:
+        return Paragraph(inline(text), style, **kwargs)
+    except ValueError:
+        # Markup the inline rules produced but ReportLab can't parse: fall back to plain text
+        return Paragraph(escape(text), style, **kwargs)
+
+def _table(rows, styles, width):
+    from reportlab.lib.colors import HexColor
+    from reportlab.platypus import Table, TableStyle
+    cells = [[cell.strip() for cell in row.strip().strip("|").split("|")] for row in rows]
+    columns = max(len(row) for row in cells)
+    data = [[_paragraph(cell, styles["Cell"]) for cell in row + [""] * (columns - len(row))] for row in cells]
+    table = Table(data, colWidths=[width / columns] * columns, repeatRows=1)
+    table.setStyle(TableStyle([
+        ("GRID", (0, 0), (-1, -1), 0.5, HexColor("#CBD5E1")),
+        ("BACKGROUND", (0, 0), (-1, 0), HexColor("#E2E8F0")),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ]))
+    return table
+
+def markdown_flowables(text, styles, width):
+    # Generator: yields each block as soon as its last line has been read
+    from reportlab.lib.colors import HexColor
+    from reportlab.platypus import Preformatted, Spacer
+    from reportlab.platypus.flowables import HRFlowable
+    lines = text.splitlines()
+    paragraph = []
+    i = 0
+
+    def flush():
+        if paragraph:
+            block = " ".join(line.strip() for line in paragraph)
+            paragraph.clear()
+            return _paragraph(block, styles["BodyText"])
+
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        heading = HEADING.match(stripped)
+        item = LIST_ITEM.match(line)
+        block = None
+        if stripped.startswith("```"):
+            code = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith("```"):
+                code.append(lines[i])
+                i += 1
+            block = Preformatted("\n".join(code), styles["Code"])
+        elif not stripped:
+            pass
+        elif heading:
+            block = _paragraph(heading.group(2), styles[f"Heading{min(len(heading.group(1)), 4)}"])
+        elif RULE.match(stripped):
+            block = HRFlowable(width="100%", thickness=0.5, color=HexColor("#94A3B8"), spaceBefore=6, spaceAfter=6)
+        elif stripped.startswith("|") and i + 1 < len(lines) and TABLE_SEPARATOR.match(lines[i + 1]):
+            rows = [line]
+            i += 2
+            while i < len(lines) and lines[i].strip().startswith("|"):
+                rows.append(lines[i])
+                i += 1
+            i -= 1
+            block = _table(rows, styles, width)
+        elif item:
+            text_lines = [item.group(3)]
+            while i + 1 < len(lines) and lines[i + 1].strip() and not LIST_ITEM.match(lines[i + 1]) \
+                    and lines[i + 1].startswith((" ", "\t")):
+                i += 1
+                text_lines.append(lines[i].strip())
+            marker = item.group(2)
+            depth = min(len(item.group(1).expandtabs(4)) // 2, 3)
+            block = _paragraph(" ".join(text_lines), styles[f"Bullet{depth}"], bulletText="•" if marker in "-*+" else marker)
+        elif stripped.startswith(">"):
+            block = _paragraph(stripped.lstrip("> "), styles["Quote"])
+        else:
+            paragraph.append(line)
+            i += 1
+            continue
+        pending = flush()
+        if pending is not None:
+            yield pending
+        if block is not None:
+            yield block
+        yield Spacer(1, 2)
+        i += 1
+    pending = flush()
+    if pending is not None:
+        yield pending
+
+def keep_with_next(flowables):
+    # The build only sees one block at a time, so ReportLab's keepWithNext lookahead
+    # can't keep a heading off the bottom of a page: each heading (and any heading
+    # right below it) is joined with the block that follows into one KeepTogether
+    from reportlab.platypus import KeepTogether, Paragraph, Spacer
+    held = []
+    for flowable in flowables:
+        if (held and isinstance(flowable, Spacer)) or \
+                (isinstance(flowable, Paragraph) and flowable.style.name.startswith("Heading")):
+            held.append(flowable)
+        elif held:
+            yield KeepTogether(held + [flowable])
+            held = []
+        else:
+            yield flowable
+    yield from held
+
+class _FlowableStream(list):
+    # ReportLab's build loop only ever looks at the head of its flowable list (and puts
+    # split remainders back at the front), so the list is refilled from the generator
+    # one block at a time whenever it runs empty
+    def __init__(self, flowables):
+        super().__init__()
+        self._flowables = flowables
+
+    def __len__(self):
+        if not list.__len__(self):
+            nxt = next(self._flowables, None)
+            if nxt is not None:
+                self.append(nxt)
+        return list.__len__(self)
+
+### Rendering
+def render_pdf(markdown, title, path, incremental=True):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+    start = time.perf_counter()
+    styles = _styles()
+    doc = SimpleDocTemplate(path, pagesize=A4, title=title, leftMargin=2 * cm, rightMargin=2 * cm,
+                            topMargin=2 * cm, bottomMargin=2 * cm)
+
+    def page_number(canvas, doc):
+        canvas.setFont("Helvetica", 8)
+        canvas.drawRightString(A4[0] - 2 * cm, 1.2 * cm, str(doc.page))
+
+    def blocks():
+        yield Paragraph(escape(title), styles["Title"])
+        yield Spacer(1, 12)
+        yield from keep_with_next(markdown_flowables(markdown, styles, doc.width))
+
+    flowables = _FlowableStream(blocks()) if incremental else list(blocks())
+    doc.build(flowables, onFirstPage=page_number, onLaterPages=page_number)
+    return {"seconds": time.perf_counter() - start, "pages": doc.page, "bytes": os.path.getsize(path)}
+
+### Cached background export
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix="pdf-export")
+_pending = {}
+_lock = threading.Lock()
+
+def pdf_path(markdown, title):
+    key = hashlib.sha256(f"{title}\0{markdown}".encode("utf-8")).hexdigest()
+    return os.path.join(PDF_CACHE_DIR, f"{key}.pdf")
+
+def _evict():
+    # Keep the cache directory under PDF_CACHE_MAX_MB, dropping the least recently used files
+    files = [entry for entry in os.scandir(PDF_CACHE_DIR) if entry.name.endswith(".pdf")]
+    total = sum(entry.stat().st_size for entry in files)
+    for entry in sorted(files, key=lambda e: e.stat().st_atime):
+        if total <= PDF_CACHE_MAX_MB * 1024 * 1024:
+            break
+        total -= entry.stat().st_size
+        os.remove(entry.path)
+
+def _export(markdown, title, path):
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    stats = render_pdf(markdown, title, tmp)
+    os.replace(tmp, path)
+    logger.info("PDF export: %d pages, %.1f KiB in %.2f s", stats["pages"], stats["bytes"] / 1024, stats["seconds"])
+    _evict()
+    return path
+
+def export_pdf(markdown, title):
+    # Returns a future of the PDF's path. A cached PDF is returned right away, and
+    # concurrent requests for the same content share one render.
+    path = pdf_path(markdown, title)
+    with _lock:
+        if os.path.exists(path):
+            os.utime(path)
+            future = concurrent.futures.Future()
+            future.set_result(path)
+            return future
+        future = _pending.get(path)
+        if future is None:
+            future = _pending[path] = _executor.submit(_export, markdown, title, path)
+            future.add_done_callback(lambda _: _pending.pop(path, None))
+        return future
+
+def pdf_bytes(markdown, title):
+    with open(export_pdf(markdown, title).result(), "rb") as f:
+        return f.read()
@@ -0,0 +1,786 @@
+import os
+import math
+import asyncio
+import contextlib
+import functools
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+
+from langchain_groq import ChatGroq
+from pydantic import BaseModel, Field, create_model
+from typing_extensions import TypedDict, Annotated
+from typing import operator
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.exceptions import OutputParserException
+from pydantic import ValidationError
+from langgraph.types import Send, RetryPolicy
+from langgraph.config import get_stream_writer
+from langgraph.errors import GraphBubbleUp
+from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+import aiosqlite
+
+from cache import llm_cache
+from topic_index import get_index
+from history import get_history
+from scheduler import scheduler
+from singleflight import SingleFlight
+from settings import (SECTION_CONCURRENCY, EDIT_MODE, CHECKPOINT_PATH, LLM_PROVIDER, FAKE_LLM_LATENCY,
+                      FAKE_LLM_WORDS, FAKE_LLM_SECTIONS, FAKE_LLM_ERROR_RATE, FAKE_LLM_SEED,
+                      MODEL_ROUTES, ESCALATION_MODEL, TOPIC_REUSE, SECTION_BATCHING, SECTION_BATCH_MAX,
+                      SECTION_BATCH_TOKENS, EXPECTED_OUTPUT_TOKENS, REPORT_MODE, CHAPTER_CONCURRENCY,
+                      NODE_MAX_ATTEMPTS, SPECULATIVE_DEBOUNCE, SPECULATIVE_BUDGET)
+
+logger = logging.getLogger(__name__)
+
+### Model 
+# One client per role (see MODEL_ROUTES in settings.py), shared by every run; all
+# async calls go through the shared event loop below so connection pools stay bound
+# to a single loop. Responses are served from / stored in the tiered LLM cache (see
+# cache.py); cache misses wait for the shared request scheduler (see scheduler.py),
+# which also owns retries, so the client's own retries are off.
+def build_model(model_name, max_tokens=None, temperature=0.7, timeout=None):
+    if LLM_PROVIDER == "fake":
+        from fake_llm import FakeChatModel
+        return FakeChatModel(model_name = model_name, latency = FAKE_LLM_LATENCY, words = FAKE_LLM_WORDS,
+                             sections = FAKE_LLM_SECTIONS, error_rate = FAKE_LLM_ERROR_RATE, seed = FAKE_LLM_SEED,
+                             timeout = timeout, cache = llm_cache, rate_limiter = scheduler)
+    return ChatGroq(model = model_name, max_tokens = max_tokens, temperature = temperature, timeout = timeout,
+                    cache = llm_cache, rate_limiter = scheduler, max_retries = 0)
+
+models = {role: build_model(route["model"], route["max_tokens"], route["temperature"], route["timeout"])
+          for role, route in MODEL_ROUTES.items()}
+
+### Structured_Model
+class section(BaseModel):
+    name : str = Field(description= "It will contain topic in this blog")
+    description : str = Field(description= "it will contain description of the name/subtitle")
+
+class sections(BaseModel):
+    sec : list[section] = Field(description="here we will have complete section")
+    
+structured_model = models["outline"].with_structured_output(sections)
+# Larger model the outline escalates to when the outline model's structured output is invalid
+escalation_model = None
+if ESCALATION_MODEL and ESCALATION_MODEL != MODEL_ROUTES["outline"]["model"]:
+    escalation_model = build_model(ESCALATION_MODEL, MODEL_ROUTES["outline"]["max_tokens"], MODEL_ROUTES["outline"]["temperature"],
+                                   MODEL_ROUTES["outline"]["timeout"]).with_structured_output(sections)
+
+# Several sections written in one call (see SECTION_BATCHING): one entry per requested
+# section, in order. The schema pins the number of entries for each batch size.
+class written_section(BaseModel):
+    name : str = Field(description="The section title, exactly as given")
+    content : str = Field(description="The full section in Markdown, starting with its heading")
+
+@functools.lru_cache(maxsize=None)
+def batch_model(size):
+    schema = create_model("written_sections", sec=(list[written_section], Field(
+        min_length=size, max_length=size, description="The written sections, one per requested section, in the order given")))
+    return models["section"].with_structured_output(schema)
+
+def invalid_structured_output(exc):
+    # Parsing/validation failures, or Groq rejecting a malformed tool call (400 tool_use_failed)
+    return isinstance(exc, (OutputParserException, ValidationError)) or \
+        (getattr(exc, "status_code", None) == 400 and "tool_use_failed" in str(exc))
+
+### Fault isolation
+# Transient errors (429, 5xx, timeouts) are retried per call by the scheduler. What is
+# left is a malformed reply, retried here per node: get_sections, plan_chapter and final
+# through LangGraph's own retry policy, and the writers of single sections, chapters
+# and transitions inside their node (see isolated), so one bad reply only redoes its
+# own piece and a piece that still fails doesn't take the others down with it.
+NODE_RETRY = RetryPolicy(max_attempts=NODE_MAX_ATTEMPTS, initial_interval=0.5, retry_on=invalid_structured_output)
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+async def isolated(work, what, policy=NODE_RETRY):
+    # Runs work() under the retry policy; returns (result, None), or (None, the error)
+    # once its attempts are used up or the error isn't worth retrying
+    for attempt in range(1, policy.max_attempts + 1):
+        try:
+            return await work(), None
+        except GraphBubbleUp:
+            raise
+        except Exception as exc:
+            if attempt == policy.max_attempts or not policy.retry_on(exc):
+                logger.warning("%s failed after %d attempt(s): %r", what, attempt, exc)
+                return None, exc
+            await asyncio.sleep(min(policy.max_interval, policy.initial_interval * policy.backoff_factor ** (attempt - 1)))
+
+FAILED_NOTE = "> ⚠️ This section could not be generated"
+
+def placeholder(sec, exc, heading="##"):
+    # Stands in for a section (or chapter) whose writer failed, in the draft and the final text
+    return f"{heading} {sec.name}\n\n{FAILED_NOTE} ({type(exc).__name__}). Regenerate it from the Revise panel."
+
+def is_placeholder(text):
+    return text.partition("\n\n")[2].startswith(FAILED_NOTE)
+
+def fresh_replies(fresh):
+    # A section rewritten on purpose has the same prompt as before: its calls skip the
+    # LLM cache, or the rewrite would replay the old draft
+    return llm_cache.bypass() if fresh and llm_cache is not None else contextlib.nullcontext()
+
+### Prompts
+OUTLINE_PROMPT = ("You are an expert technical blog writer. ""Your task is to generate a clean, well-structured blog outline using the provided schema. ""Each item in the 'sec' list represents one section of the blog. ""For every section, provide: \n""1. 'name' → the section title\n""2. 'description' → a clear, concise explanation of what will be written in that section.\n\n""Guidelines:\n""- Begin with an introductory section.\n""- Follow with 4–8 logical sections covering the full topic.\n""- Keep descriptions short but meaningful (2–4 sentences).\n""- Maintain logical flow from basic to advanced.\n""- Do NOT add content outside the schema. Only return fields defined in the schema.\n""- Output MUST strictly follow the Pydantic 'sections' structure.\n""Wait for the user's query and generate sections accordingly.")
+
+SECTION_PROMPT = ("You are a professional technical writer. Use Markdown Format to generate. Your job is to generate full blog content ""based strictly on the provided section names and descriptions.\n\n""For each section in the input:\n""- Use the 'name' as the section heading.\n""- Use the 'description' to guide the depth, theme, and direction of writing.\n""- Expand each section into a detailed, well-written explanation (150–300 words per section).\n""- Write in clear, simple, expert-level English.\n""- Do NOT rewrite the outline.\n""- Do NOT add new sections.\n""- Do NOT return JSON.\n""- Only return the final written blog content, properly formatted with headings.\n")
+
+BATCH_SECTION_PROMPT = (SECTION_PROMPT + "\nYou will be given several sections at once. Write each of them in full, exactly as you ""would if it were the only one, and return them using the provided schema: one entry per section, in the ""order given, with the section name unchanged.")
+
+CHAPTER_OUTLINE_PROMPT = ("You are an expert technical writer planning a long-form technical report. ""Generate the report's chapters using the provided schema. ""Each item in the 'sec' list represents one chapter of the report. ""For every chapter, provide: \n""1. 'name' → the chapter title\n""2. 'description' → what the chapter covers, in enough detail to plan its sub-sections.\n\n""Guidelines:\n""- Begin with an introductory chapter.\n""- Follow with 6–15 chapters covering the full topic in depth, from fundamentals to advanced material.\n""- Chapters must not overlap.\n""- Output MUST strictly follow the Pydantic 'sections' structure.")
+
+SUBSECTION_PROMPT = ("You are an expert technical writer planning one chapter of a long-form technical report. ""Using the provided schema, split the chapter the user gives you into its sub-sections. ""For every sub-section, provide: \n""1. 'name' → the sub-section title\n""2. 'description' → a clear, concise explanation of what will be written in it (2–4 sentences).\n\n""Guidelines:\n""- Use 3–8 sub-sections in a logical order.\n""- Stay within the chapter: the other chapters of the report are listed so you don't repeat them.\n""- Do not add an introduction to the whole report or a conclusion to the whole report.\n""- Output MUST strictly follow the Pydantic 'sections' structure.")
+
+EDITOR_PROMPT = ("You are an expert editor and technical content specialist. Your task is to take the complete blog ""provided by the user and refine it for final publication.\n\n""Your responsibilities:\n""- Improve clarity, flow, and readability without changing the meaning.\n""- Fix grammar, punctuation, and sentence structure.\n""- Enhance transitions between ideas so the blog reads smoothly.\n""- Strengthen the tone to sound polished, professional, and engaging.\n""- Keep all technical details, facts, and structure exactly as provided.\n""- Do NOT add new sections or new concepts.\n""- Do NOT remove user-provided content unless it is repetitive or unclear.\n""- Do NOT alter the factual meaning.\n""- Return ONLY the improved blog text — no explanations, no bullet points, no commentary.\n\n""Your goal is to make the blog feel complete, publication-ready, and professional.")
+
+SECTION_EDITOR_PROMPT = ("You are an expert editor and technical content specialist. Your task is to take ONE section of a blog ""provided by the user and refine it for final publication.\n\n""Your responsibilities:\n""- Improve clarity, flow, and readability without changing the meaning.\n""- Fix grammar, punctuation, and sentence structure.\n""- Strengthen the tone to sound polished, professional, and engaging.\n""- Keep the heading, all technical details, facts, and structure exactly as provided.\n""- Do NOT add new sections or new concepts.\n""- Do NOT alter the factual meaning.\n""- Return ONLY the improved section text — no explanations, no commentary.")
+
+TRANSITION_PROMPT = ("You are an expert editor. The user gives you the closing paragraph of one blog section and the opening paragraph ""of the section that follows it.\n\n""Rewrite ONLY the opening paragraph so the blog transitions naturally from the previous section.\n""- Keep its meaning, facts, Markdown formatting and roughly its length.\n""- Do NOT repeat the closing paragraph.\n""- Return ONLY the rewritten opening paragraph — no explanations, no commentary.")
+
+### State
+class State(TypedDict):
+    topic : str
+    section : list[section]
+    complete_sections: Annotated[list[str], operator.add]
+    edited_sections: Annotated[list[str], operator.add]
+    # Sections (chapters, in a long report) left as placeholders after their writer failed
+    failed_sections: Annotated[list[str], operator.add]
+    report : str
+    final : str
+    # The final text cut per section (in outline order), so a later revision can keep it
+    final_sections : list[str]
+    # Set when the run starts from earlier work: the stored section drafts by section
+    # name (see revision_input and topic_index.py), and which topic they came from
+    reuse : dict
+    reused_from : dict
+    # Sections a revision writes again on purpose (ticked Rewrite, or failed last time)
+    rewrite : list[str]
+
+# One chapter of a long report (see write_chapter): its sub-outline and leaf drafts
+# stay in this state and never reach the report's own State
+class ChapterState(TypedDict):
+    topic : str
+    chapters : list[section]
+    chapter : section
+    section : list[section]
+    complete_sections: Annotated[list[str], operator.add]
+    edited_sections: Annotated[list[str], operator.add]
+    failed_sections: Annotated[list[str], operator.add]
+    draft : str
+    text : str
+
+class ChapterOutput(TypedDict):
+    draft : str
+    text : str
+    failed_sections : list[str]
+
+### Node
+def session_id(config):
+    return config.get("configurable", {}).get("session_id", "default")
+
+async def call_model(runnable, messages, config, output_tokens=EXPECTED_OUTPUT_TOKENS, validate=None):
+    # Every model call goes through the scheduler: fair queuing per session, rate
+    # limits and retries with backoff. A malformed reply (empty text, or rejected by
+    # validate) is dropped from the LLM cache before it is raised, so retrying the node
+    # asks the model again
+    async def attempt():
+        with llm_cache.track_writes() if llm_cache is not None else contextlib.nullcontext() as written:
+            try:
+                response = await runnable.ainvoke(messages)
+                if isinstance(response, AIMessage) and not str(response.content).strip():
+                    raise OutputParserException("empty reply")
+                if validate is not None:
+                    validate(response)
+                return response
+            except Exception as exc:
+                if written and invalid_structured_output(exc):
+                    llm_cache.forget(written)
+                raise
+    return await scheduler.call(session_id(config), messages, attempt, output_tokens)
+
+def report_mode(config):
+    return config.get("configurable", {}).get("report_mode", REPORT_MODE)
+
+async def get_sections(state:State, config):
+    if state.get("section"):
+        # Outline reused from a similar past topic
+        return {"section" : state["section"]}
+    if report_mode(config) == "long":
+        # Long report: the outline is the list of chapters
+        messages = [SystemMessage(content=CHAPTER_OUTLINE_PROMPT),
+                    HumanMessage(content=f"Here is the topic of my report {state['topic']}")]
+    else:
+        messages = [SystemMessage(content=OUTLINE_PROMPT),
+                    HumanMessage(content=f"Here is the topic name of my blog {state['topic']}")]
+    response = await plan_outline(messages, config)
+    logger.debug("outline for %r: %s", state['topic'], response.sec)
+    return {"section" : response.sec}
+
+def check_outline(response):
+    if not response.sec:
+        raise OutputParserException("empty outline")
+
+async def plan_outline(messages, config):
+    try:
+        response = await call_model(structured_model, messages, config, validate=check_outline)
+    except Exception as exc:
+        if escalation_model is None or not invalid_structured_output(exc):
+            raise
+        logger.info("outline model failed validation (%r); escalating to %s", exc, ESCALATION_MODEL)
+        response = await call_model(escalation_model, messages, config, validate=check_outline)
+    return response
+
+def edit_mode(config):
+    return config.get("configurable", {}).get("edit_mode", EDIT_MODE)
+
+async def polish_section(text, config):
+    response = await call_model(models["editor"], [SystemMessage(content=SECTION_EDITOR_PROMPT),
+                                                   HumanMessage(content=f"Here is the section {text}")], config)
+    return response.content
+
+async def smooth_transition(previous, current, config):
+    paragraphs = current.strip().split("\n\n")
+    # The heading stays as is; the first body paragraph is the one that opens the section
+    opening = next((i for i, p in enumerate(paragraphs) if not p.lstrip().startswith("#")), None)
+    if opening is None or is_placeholder(previous) or is_placeholder(current):
+        return current
+    closing = previous.strip().split("\n\n")[-1]
+    response = await call_model(models["editor"], [SystemMessage(content=TRANSITION_PROMPT),
+                                                   HumanMessage(content=f"Closing paragraph of the previous section:\n{closing}\n\n"
+                                                                        f"Opening paragraph to rewrite:\n{paragraphs[opening]}")], config)
+    paragraphs[opening] = response.content.strip()
+    return "\n\n".join(paragraphs)
+
+async def polished(draft, config):
+    # A section that can't be polished keeps its draft; placeholders are left as they are
+    if is_placeholder(draft):
+        return draft
+    text, error = await isolated(lambda: polish_section(draft, config), "polishing a section")
+    return draft if error else text
+
+async def transition(previous, current, config):
+    # A join that can't be smoothed is left as it was
+    text, error = await isolated(lambda: smooth_transition(previous, current, config), "smoothing a transition")
+    return current if error else text
+
+def keep_placeholders(failed):
+    # Appended to a whole-text edit when some sections are placeholders
+    return ("\n\nKeep the quoted notes marking sections that could not be generated exactly as they are."
+            if failed else "")
+
+async def each_section_output(state:State, config):
+    stored = state.get("stored")
+    if stored:
+        # Draft (and polished version, if there is one) reused from a similar past topic
+        if edit_mode(config) == "mapreduce":
+            return {"complete_sections" : [stored["draft"]],
+                    "edited_sections" : [stored.get("edited") or await polished(stored["draft"], config)]}
+        return {"complete_sections" : [stored["draft"]]}
+    with fresh_replies(state.get("fresh")):
+        return await write_sections(state.get("batch") or [state["section"]], config)
+
+async def write_sections(batch, config):
+    drafts, error = None, None
+    if len(batch) > 1:
+        drafts, error = await isolated(lambda: write_batch(batch, config), f"batch of {len(batch)} sections", NO_RETRY)
+    if drafts is None:
+        # One section at a time (also when a batch failed), each with its own attempts
+        results = await asyncio.gather(*(isolated(lambda sec=sec: write_section(sec, config), f"section {sec.name!r}")
+                                         for sec in batch))
+        drafts = [draft if error is None else placeholder(sec, error) for sec, (draft, error) in zip(batch, results)]
+    update = {"complete_sections" : drafts, "failed_sections" : [sec.name for sec, draft in zip(batch, drafts)
+                                                                 if is_placeholder(draft)]}
+    if edit_mode(config) == "mapreduce":
+        update["edited_sections"] = list(await asyncio.gather(*(polished(draft, config) for draft in drafts)))
+    return update
+
+async def write_section(sec, config):
+    response = await call_model(models["section"], [SystemMessage(content=SECTION_PROMPT),
+                                                    HumanMessage(content=f"here is the name of the subtopic : {sec.name} and description is {sec.description}")], config)
+    return response.content
+
+async def write_batch(batch, config):
+    # One structured call for consecutive sections; raises when the reply can't be split
+    # back into exactly these sections (each_section_output then writes them one by one)
+    listing = "\n".join(f"{i}. name : {sec.name} and description is {sec.description}" for i, sec in enumerate(batch, 1))
+    messages = [SystemMessage(content=BATCH_SECTION_PROMPT), HumanMessage(content=f"here are the subtopics :\n{listing}")]
+    def check(response):
+        if len(response.sec) != len(batch) or not all(written.content.strip() for written in response.sec):
+            raise OutputParserException(f"{len(response.sec)} sections returned for a batch of {len(batch)}")
+
+    response = await call_model(batch_model(len(batch)), messages, config, output_tokens=len(batch) * EXPECTED_OUTPUT_TOKENS,
+                                validate=check)
+    return [written.content for written in response.sec]
+
+def section_batch_size(count, config):
+    # Sections per write call: capped by the output tokens one call may produce; packed
+    # as tightly as that allows when the request budget can't cover a call per section
+    # right now, otherwise kept to about two per call so the writers still run in parallel
+    if config.get("configurable", {}).get("section_batching", SECTION_BATCHING) != "auto" or count < 2:
+        return 1
+    limit = max(1, min(SECTION_BATCH_MAX, SECTION_BATCH_TOKENS // EXPECTED_OUTPUT_TOKENS))
+    requests, tokens = scheduler.headroom()
+    # A batch bigger than the token headroom would wait for a refill; smaller ones can start now
+    limit = max(1, min(limit, int(tokens // EXPECTED_OUTPUT_TOKENS)))
+    batches = math.ceil(count / limit)
+    if requests >= count:
+        batches = max(batches, min(config.get("max_concurrency") or SECTION_CONCURRENCY, count // 2))
+    return math.ceil(count / batches)
+
+def assign_worker(state: State, config):
+    # Sections reused from earlier work keep a worker each (no call is made for them);
+    # runs of consecutive new sections are split into batches, so order is preserved
+    reuse, rewrite = state.get("reuse") or {}, set(state.get("rewrite") or [])
+    size = section_batch_size(sum(s.name not in reuse for s in state["section"]), config)
+    sends, pending = [], []
+
+    def flush():
+        for i in range(0, len(pending), size):
+            chunk = pending[i:i + size]
+            sends.append(Send("each_section_output", {"section": chunk[0], "batch": chunk if len(chunk) > 1 else None,
+                                                      "fresh": any(s.name in rewrite for s in chunk)}))
+        pending.clear()
+
+    for s in state["section"]:
+        if s.name in reuse:
+            flush()
+            sends.append(Send("each_section_output", {"section": s, "stored": reuse[s.name]}))
+        else:
+            pending.append(s)
+    flush()
+    return sends
+
+### Long reports
+# Each chapter runs as its own small graph: plan its sub-sections, fan out the same
+# section workers as a blog (batching included), then assemble and edit the chapter.
+# The report only receives the chapter's draft and edited text.
+async def plan_chapter(state : ChapterState, config):
+    others = "\n".join(f"- {ch.name}" for ch in state["chapters"] if ch.name != state["chapter"].name)
+    response = await plan_outline([SystemMessage(content=SUBSECTION_PROMPT),
+                                   HumanMessage(content=f"Report topic: {state['topic']}\n"
+                                                        f"Chapter: {state['chapter'].name} — {state['chapter'].description}\n"
+                                                        f"Other chapters:\n{others}")], config)
+    return {"section" : response.sec}
+
+async def assemble_chapter(state : ChapterState, config):
+    heading = f"# {state['chapter'].name}"
+    draft = "\n\n".join([heading] + state["complete_sections"])
+    failed = state.get("failed_sections") or []
+    if edit_mode(config) == "mapreduce":
+        # Sub-sections were polished as they were written; smooth the joins between them
+        edited = state["edited_sections"]
+        pieces = [edited[0]] + list(await asyncio.gather(*(transition(edited[i - 1], edited[i], config)
+                                                          for i in range(1, len(edited)))))
+        return {"draft" : draft, "text" : "\n\n".join([heading] + pieces), "failed_sections" : failed}
+    response, error = await isolated(lambda: call_model(models["editor"], [SystemMessage(content=EDITOR_PROMPT),
+                                                                           HumanMessage(content=f"Here is one chapter of a longer report {draft}{keep_placeholders(failed)}")], config),
+                                     f"editing chapter {state['chapter'].name!r}")
+    # An unedited chapter beats a lost one
+    return {"draft" : draft, "text" : draft if error else response.content, "failed_sections" : failed}
+
+chapter_graph = StateGraph(ChapterState, output_schema=ChapterOutput)
+chapter_graph.add_node("plan_chapter", plan_chapter, retry_policy=NODE_RETRY)
+chapter_graph.add_node("each_section_output", each_section_output)
+chapter_graph.add_node("assemble_chapter", assemble_chapter)
+chapter_graph.add_edge(START, "plan_chapter")
+chapter_graph.add_conditional_edges("plan_chapter", assign_worker, ["each_section_output"])
+chapter_graph.add_edge("each_section_output", "assemble_chapter")
+chapter_graph.add_edge("assemble_chapter", END)
+chapter_graph = chapter_graph.compile()
+
+async def write_chapter(state : ChapterState, config):
+    # The report's writer budget is split between the chapters running at once
+    writers = max(1, config["configurable"].get("section_concurrency", SECTION_CONCURRENCY) // CHAPTER_CONCURRENCY)
+    chapter = state["chapter"]
+    # Its nodes retry on their own, so the chapter as a whole isn't attempted again
+    with fresh_replies(state.get("fresh")):
+        result, error = await isolated(lambda: chapter_graph.ainvoke({"topic": state["topic"], "chapters": state["chapters"],
+                                                                      "chapter": chapter}, {**config, "max_concurrency": writers}),
+                                       f"chapter {chapter.name!r}", NO_RETRY)
+    if error:
+        text = placeholder(chapter, error, heading="#")
+        return {"complete_sections" : [text], "edited_sections" : [text], "failed_sections" : [chapter.name]}
+    # A chapter with failed sub-sections is listed as failed, so a revision rewrites it
+    return {"complete_sections" : [result["draft"]], "edited_sections" : [result["text"]],
+            "failed_sections" : [chapter.name] if result.get("failed_sections") else []}
+
+def fan_out(state : State, config):
+    if report_mode(config) != "long":
+        return assign_worker(state, config)
+    # One chapter writer per chapter; chapters kept from an earlier run (revisions) are
+    # returned as they were by a plain section worker
+    reuse, rewrite = state.get("reuse") or {}, set(state.get("rewrite") or [])
+    return [Send("each_section_output", {"section": ch, "stored": reuse[ch.name]}) if ch.name in reuse else
+            Send("write_chapter", {"topic": state["topic"], "chapters": state["section"], "chapter": ch,
+                                   "fresh": ch.name in rewrite})
+            for ch in state["section"]]
+
+def report(state : State):
+    respose = state["complete_sections"]
+    res = '\n\n----\n\n'.join(respose)
+    return {"report" : res}
+
+def split_sections(text, outline):
+    # Cuts a whole edited blog at the headings of its sections, in outline order;
+    # empty when a heading can't be found
+    lines = text.split("\n")
+    starts, pos = [], 0
+    for sec in outline:
+        name = sec.name.strip().lower()
+        start = next((i for i in range(pos, len(lines)) if lines[i].lstrip().startswith("#") and name in lines[i].lower()), None)
+        if start is None:
+            return []
+        starts.append(start)
+        pos = start + 1
+    starts[0] = 0
+    return ["\n".join(lines[a:b]).strip().removesuffix("----").strip() for a, b in zip(starts, starts[1:] + [len(lines)])]
+
+async def final(state : State, config):
+    # Every attempt (NODE_RETRY) is announced on the stream, so the tokens streamed by
+    # a failed one can be dropped (see run_events)
+    get_stream_writer()({"attempt": "final"})
+    # Chapters of a long report are already edited: only the joins between them are redone.
+    # Without one polished text per outline row (a thread started in another mode) the
+    # single-pass editor goes over the whole report instead, or for a long report (too
+    # big for one prompt) the joined drafts are kept as they are
+    edited, outline = state.get("edited_sections") or [], state["section"]
+    if report_mode(config) == "long" and len(edited) != len(outline):
+        logger.warning("no edited chapter per outline row; the long report keeps its drafts")
+        return {"final" : state["report"], "final_sections" : split_sections(state["report"], outline)}
+    if report_mode(config) == "long" or (edit_mode(config) == "mapreduce" and len(edited) == len(outline)):
+        reuse = state.get("reuse") or {}
+        rewrite = set(state.get("rewrite") or [])
+
+        async def piece(i):
+            # A section kept from an earlier run keeps its final text while the section
+            # before it is unchanged too; only the transitions around changes are redone
+            stored = reuse.get(outline[i].name) or {}
+            previous = outline[i - 1].name if i else None
+            if stored.get("final") and stored.get("after") == previous and (previous is None or previous in reuse):
+                return stored["final"]
+            if not i:
+                return edited[0]
+            with fresh_replies(outline[i].name in rewrite or previous in rewrite):
+                return await transition(edited[i - 1], edited[i], config)
+
+        pieces = list(await asyncio.gather(*(piece(i) for i in range(len(edited)))))
+        return {"final" : "\n\n".join(pieces), "final_sections" : pieces}
+    response = await call_model(models["editor"], [SystemMessage(content=EDITOR_PROMPT),
+                                                   HumanMessage(content=f"Here is the full blog {state['report']}"
+                                                                        f"{keep_placeholders(state.get('failed_sections'))}")], config)
+    return {"final" : response.content, "final_sections" : split_sections(response.content, state["section"])}
+
+def duplicate_sections(outline):
+    # Names used by more than one section of an outline, in outline order
+    names = [sec.name if isinstance(sec, section) else sec["name"] for sec in outline]
+    return [name for i, name in enumerate(names) if names.count(name) > 1 and names.index(name) == i]
+
+def revision_input(previous, outline, rewrite=()):
+    # Graph input that redoes only what changed since `previous`, the final state of an
+    # earlier run: sections whose name and description are unchanged (and that are not
+    # in `rewrite`, a set of positions in the new outline) keep their draft, polished
+    # text and final text. Sections left as placeholders are always written again
+    # Revisions run in mapreduce mode so the final pass can be partial.
+    # Kept work is looked up by section name, so the new outline's names must be unique
+    # (see duplicate_sections), and sections sharing a name in the old one are written again
+    old = [sec if isinstance(sec, section) else section(**sec) for sec in previous["section"]]
+    outline = [sec if isinstance(sec, section) else section(**sec) for sec in outline]
+    if duplicate_sections(outline):
+        raise ValueError(f"section names must be unique: {', '.join(duplicate_sections(outline))}")
+    shared = set(duplicate_sections(old))
+    finals = previous.get("final_sections") or []
+    finals = finals if len(finals) == len(old) else [None] * len(old)
+    edited = previous.get("edited_sections") or []
+    # A single-pass edit has no polished sections of its own; its final text per section stands in
+    edited = edited if len(edited) == len(old) else finals
+    stored = {}
+    for i, (sec, draft) in enumerate(zip(old, previous["complete_sections"])):
+        if sec.name in shared:
+            continue
+        stored[sec.name] = {"description": sec.description, "draft": draft, "edited": edited[i],
+                            "final": finals[i], "after": old[i - 1].name if i else None}
+    # (reports reopened from the history only have their drafts to tell)
+    failed = set(previous.get("failed_sections") or []) | {sec.name for sec, draft in zip(old, previous["complete_sections"])
+                                                           if FAILED_NOTE in draft}
+    reuse = {sec.name: stored[sec.name] for i, sec in enumerate(outline)
+             if sec.name in stored and stored[sec.name]["description"] == sec.description and i not in rewrite
+             and sec.name not in failed}
+    # Written again with unchanged prompts, so their calls must not come from the LLM cache
+    again = [sec.name for i, sec in enumerate(outline) if i in rewrite or sec.name in failed]
+    return {"topic": previous["topic"], "section": outline, "reuse": reuse, "rewrite": again}
+
+### Runner
+# A single long-lived event loop runs every graph execution in the process.
+# Synchronous callers (the Streamlit script thread) hand their coroutines to it
+# instead of spinning up a new loop per run.
+_loop = asyncio.new_event_loop()
+threading.Thread(target=_loop.run_forever, name="report-graph-loop", daemon=True).start()
+
+def run_sync(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
+
+def iter_sync(agen):
+    async def _next():
+        return await agen.__anext__()
+    try:
+        while True:
+            try:
+                yield run_sync(_next())
+            except StopAsyncIteration:
+                return
+    finally:
+        run_sync(agen.aclose())
+
+### Checkpointer
+# Every super-step is persisted under the run's thread id, including the writes of
+# section workers that finished in a step where another worker failed. Invoking the
+# same thread again with None as input picks up from there instead of starting over.
+async def _open_checkpointer():
+    if os.path.dirname(CHECKPOINT_PATH):
+        os.makedirs(os.path.dirname(CHECKPOINT_PATH), exist_ok=True)
+    conn = await aiosqlite.connect(CHECKPOINT_PATH)
+    saver = AsyncSqliteSaver(conn)
+    await saver.setup()
+    return saver
+
+checkpointer = run_sync(_open_checkpointer())
+
+### StateGraph
+graph = StateGraph(State)
+graph.add_node("get_sections", get_sections, retry_policy=NODE_RETRY)
+graph.add_node("each_section_output", each_section_output)
+graph.add_node("write_chapter", write_chapter)
+graph.add_node("report", report)
+graph.add_node("final", final, retry_policy=NODE_RETRY)
+graph.add_edge(START, "get_sections")
+graph.add_conditional_edges("get_sections", fan_out, ["each_section_output", "write_chapter"])
+graph.add_edge("each_section_output", "report")
+graph.add_edge("write_chapter", "report")
+graph.add_edge("report","final")
+graph.add_edge("final", END)
+graph = graph.compile(checkpointer=checkpointer)
+
+def new_thread_id():
+    return uuid.uuid4().hex
+
+def run_config(concurrency=None, thread_id=None, edit=None, callbacks=None, session=None, reuse=None, batching=None,
+               mode=None):
+    # session groups runs for fair queuing in the scheduler (one per UI user / batch job);
+    # reuse is "off", "outline" or "sections" (see TOPIC_REUSE); batching "off" or "auto";
+    # mode "blog" or "long" (see REPORT_MODE). A long report writes CHAPTER_CONCURRENCY
+    # chapters at once, each with its share of the section writers.
+    thread_id = thread_id or new_thread_id()
+    concurrency = concurrency or SECTION_CONCURRENCY
+    mode = mode or REPORT_MODE
+    return {"max_concurrency": CHAPTER_CONCURRENCY if mode == "long" else concurrency,
+            "configurable": {"thread_id": thread_id, "edit_mode": edit or EDIT_MODE, "session_id": session or thread_id,
+                             "topic_reuse": reuse or TOPIC_REUSE, "section_batching": batching or SECTION_BATCHING,
+                             "report_mode": mode, "section_concurrency": concurrency},
+            "callbacks": callbacks or []}
+
+async def prepare_run(topic, config):
+    # Returns the graph input for this thread plus whatever state a previous,
+    # unfinished attempt for the same topic already produced. A fresh run starts from
+    # the session's speculative outline when there is one for this topic
+    snapshot = await graph.aget_state(config)
+    if snapshot.next and snapshot.values.get("topic") == topic:
+        return None, snapshot.values
+    return await take_speculation(topic, config) or await reuse_similar(topic, config), {}
+
+async def reuse_similar(topic, config):
+    # Fresh graph input, prefilled from the most similar past topic when reuse is on
+    # Long reports are not matched: their outlines are chapters, not sections
+    reuse = config["configurable"].get("topic_reuse", TOPIC_REUSE)
+    index = await asyncio.to_thread(get_index) if reuse != "off" and report_mode(config) != "long" else None
+    if index is None:
+        return {"topic": topic}
+    try:
+        match = await asyncio.to_thread(index.match, topic)
+    except Exception:
+        logger.warning("topic index lookup failed", exc_info=True)
+        return {"topic": topic}
+    if match is None:
+        return {"topic": topic}
+    outline = [section(**sec) for sec in match["outline"]]
+    graph_input = {"topic": topic, "section": outline,
+                   "reused_from": {"topic": match["topic"], "score": round(match["score"], 3), "sections": False}}
+    if reuse == "sections" and len(match["drafts"]) == len(outline):
+        edited = match["edited"] if len(match["edited"]) == len(outline) else [None] * len(outline)
+        graph_input["reuse"] = {sec.name: {"draft": draft, "edited": polished}
+                                for sec, draft, polished in zip(outline, match["drafts"], edited)}
+        graph_input["reused_from"]["sections"] = True
+    return graph_input
+
+async def finish_run(config, metrics=None):
+    # A finished report is added to the report history (with the run's metrics summary)
+    # and, unless some of its sections failed, the topic index, and no longer needs its
+    # checkpoints. Returns its final state (the starting point of a revision)
+    values = (await graph.aget_state(config)).values
+    history = await asyncio.to_thread(get_history) if values.get("final") else None
+    if history is not None:
+        try:
+            await asyncio.to_thread(history.add, values["topic"], [sec.model_dump() for sec in values["section"]],
+                                    values["final"], values.get("report", ""), values.get("complete_sections", []),
+                                    values.get("edited_sections", []), values.get("final_sections", []),
+                                    report_mode(config), edit_mode(config), metrics)
+        except Exception:
+            logger.warning("could not add %r to the report history", values["topic"], exc_info=True)
+    complete = values.get("final") and not values.get("failed_sections")
+    index = await asyncio.to_thread(get_index) if complete and report_mode(config) != "long" else None
+    if index is not None and len(values.get("complete_sections", [])) == len(values["section"]):
+        try:
+            await asyncio.to_thread(index.add, values["topic"], [sec.model_dump() for sec in values["section"]],
+                                    values["complete_sections"], values.get("edited_sections", []))
+        except Exception:
+            logger.warning("could not add %r to the topic index", values["topic"], exc_info=True)
+    await checkpointer.adelete_thread(config["configurable"]["thread_id"])
+    return values
+
+async def run_events(graph_input, restored, config):
+    # A run as the events the app shows: ("reused", None, reused_from), ("resumed", None, None)
+    # plus the updates restored from the checkpoint, then ("update", node, update) per
+    # node and ("token", "final", text) per token of the final edit. ("retry", "final", None)
+    # means the final edit is being retried: the tokens streamed so far are void
+    if graph_input and graph_input.get("reused_from"):
+        yield "reused", None, graph_input["reused_from"]
+    if graph_input is None:
+        yield "resumed", None, None
+        for node, key in (("get_sections", "section"), ("report", "report")):
+            if restored.get(key):
+                yield "update", node, {key: restored[key]}
+    attempts = 0
+    async for mode, chunk in graph.astream(graph_input, config, stream_mode=["updates", "messages", "custom"]):
+        if mode == "custom":
+            if chunk.get("attempt") == "final":
+                attempts += 1
+                if attempts > 1:
+                    yield "retry", "final", None
+            continue
+        if mode == "messages":
+            message, metadata = chunk
+            if metadata.get("langgraph_node") == "final" and message.content:
+                yield "token", "final", message.content
+            continue
+        for node, update in chunk.items():
+            if update:
+                yield "update", node, update
+
+### Single flight
+# Identical reports requested while one is being generated (several users, a double
+# click) share that run (see singleflight.py): same topic, ignoring case and spacing,
+# and the same settings that shape the report. Concurrency only changes how fast it
+# is written, so it isn't part of the key. Revisions are never shared.
+flights = SingleFlight()
+
+def flight_key(topic, config):
+    settings = config["configurable"]
+    return (" ".join(topic.split()).casefold(), settings["edit_mode"], settings["report_mode"],
+            settings["section_batching"], settings["topic_reuse"])
+
+### Speculative outline
+# The app hands every topic typed into its topic box to speculate() (SPECULATIVE_OUTLINE).
+# Once the topic has been left alone for SPECULATIVE_DEBOUNCE seconds, the graph input
+# for it (reuse_similar plus, when nothing was reused, the outline from get_sections)
+# is prepared in the background on the shared loop. prepare_run takes it when the
+# session then generates the same topic, and get_sections keeps the prefilled outline,
+# so the outline call is no longer on the critical path. One speculation per session:
+# a new topic cancels the previous one, and each session may spend SPECULATIVE_BUDGET
+# outline calls on it. Speculative calls are queued under the session like its runs.
+_speculations = OrderedDict()
+SPECULATION_SESSIONS = 1024
+speculation_stats = {"started": 0, "used": 0, "cancelled": 0}
+
+def speculation_key(topic, config):
+    # Edit mode and batching don't change the outline
+    settings = config["configurable"]
+    return (" ".join(topic.split()).casefold(), settings["report_mode"], settings["topic_reuse"])
+
+def speculate(topic, config):
+    # Called from the Streamlit script thread on every rerun; returns at once
+    asyncio.run_coroutine_threadsafe(_speculate(topic, config), _loop)
+
+async def _speculate(topic, config):
+    session, key = session_id(config), speculation_key(topic, config)
+    entry = _speculations.get(session)
+    if entry is None:
+        entry = _speculations[session] = {"key": None, "task": None, "started": False, "calling": False, "calls": 0}
+        while len(_speculations) > SPECULATION_SESSIONS:
+            _cancel_speculation(_speculations.popitem(last=False)[1])
+    _speculations.move_to_end(session)
+    # The key stays after the speculation is taken, so the topic that was just
+    # generated is not speculated again while it is still in the topic box
+    if entry["key"] == key:
+        return
+    _cancel_speculation(entry)
+    entry.update(key=key, task=None, started=False, calling=False)
+    if topic.strip() and entry["calls"] < SPECULATIVE_BUDGET:
+        entry["task"] = asyncio.ensure_future(_speculative_input(topic, config, entry))
+        # A speculation that fails and is never taken is only logged
+        entry["task"].add_done_callback(lambda task: task.cancelled() or task.exception() is None or
+                                        logger.info("speculative outline for %r failed: %r", topic, task.exception()))
+
+async def _speculative_input(topic, config, entry):
+    # Cancelled during the wait if the topic changes again
+    await asyncio.sleep(SPECULATIVE_DEBOUNCE)
+    entry["started"] = True
+    graph_input = await reuse_similar(topic, config)
+    if not graph_input.get("section"):
+        entry["calls"] += 1
+        entry["calling"] = True
+        speculation_stats["started"] += 1
+        graph_input["section"] = (await get_sections(graph_input, config))["section"]
+    return graph_input
+
+def _cancel_speculation(entry):
+    # Only a speculation whose outline call was running counts as cancelled; one
+    # still in its debounce wait or reuse lookup hasn't spent anything
+    task = entry["task"]
+    if task is not None and not task.done():
+        task.cancel()
+        speculation_stats["cancelled"] += entry["calling"]
+
+async def take_speculation(topic, config):
+    # The session's speculative graph input for this topic, waiting for it if its
+    # outline is still being written; None when there is none (or it failed)
+    entry = _speculations.get(session_id(config))
+    if entry is None or entry["task"] is None or entry["key"] != speculation_key(topic, config):
+        return None
+    task, started = entry["task"], entry["started"]
+    entry.update(task=None, started=False, calling=False)
+    if not started or task.cancelled():
+        # Still in its debounce wait: the run asks for the outline itself
+        task.cancel()
+        return None
+    try:
+        graph_input = await task
+    except Exception:
+        # Logged by the task itself; the run writes the outline the usual way
+        return None
+    speculation_stats["used"] += 1
+    return {**graph_input, "topic": topic}
+
+async def timed_run(topic, concurrency=None, edit=None):
+    start = time.perf_counter()
+    config = run_config(concurrency, edit=edit)
+    result = await graph.ainvoke({"topic": topic}, config)
+    await finish_run(config)
+    return {"topic": topic, "sections": len(result["section"]), "concurrency": concurrency or SECTION_CONCURRENCY,
+            "seconds": round(time.perf_counter() - start, 2)}
+
+if __name__ == "__main__":
+    # Wall-clock time against section count, e.g.
+    #   python pipeline.py "Intro to Rust" "Kubernetes Networking" --concurrency 1 4 8
+    import argparse
+    parser = argparse.ArgumentParser(description="Time the section fan-out for a few topics")
+    parser.add_argument("topics", nargs="+")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[SECTION_CONCURRENCY])
+    parser.add_argument("--edit-mode", choices=["single", "mapreduce"], default=EDIT_MODE)
+    args = parser.parse_args()
+    print(f"{'topic':40} {'sections':>8} {'limit':>6} {'seconds':>8}")
+    for topic in args.topics:
+        for limit in args.concurrency:
+            row = run_sync(timed_run(topic, limit, args.edit_mode))
+            print(f"{row['topic'][:40]:40} {row['sections']:>8} {row['concurrency']:>6} {row['seconds']:>8}")
@@ -0,0 +1,197 @@
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict, deque
+
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from settings import GROQ_RPM, GROQ_TPM, EXPECTED_OUTPUT_TOKENS, MAX_RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+
+try:
+    from groq import APIConnectionError
+    TRANSIENT_ERRORS = (APIConnectionError, asyncio.TimeoutError, TimeoutError)
+except ImportError:
+    TRANSIENT_ERRORS = (asyncio.TimeoutError, TimeoutError)
+
+# The session and token estimate of the request about to be sent. call() sets it;
+# LangChain then calls aacquire() from inside the same task, only on a cache miss.
+_current_request = contextvars.ContextVar("current_request", default=("default", EXPECTED_OUTPUT_TOKENS))
+
+### Token bucket
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        # A single request larger than the whole bucket is let through once it is full
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount):
+        # The level may go negative (debt) when the actual usage exceeds the estimate
+        self.level -= amount
+
+    def drain(self):
+        self.level = min(self.level, 0.0)
+
+### Scheduler
+# Shared by every model call in the process (it is the model's rate_limiter):
+# - token buckets for requests/minute and estimated tokens/minute,
+# - fair queuing: waiting requests are granted round-robin across sessions, so one
+#   session's 8-section fan-out cannot starve the others,
+# - call() retries 429s, 5xx and timeouts with full-jitter exponential backoff,
+#   honouring Retry-After; a 429 also drains the buckets so everyone backs off.
+class RequestScheduler(BaseRateLimiter):
+    def __init__(self, rpm=GROQ_RPM, tpm=GROQ_TPM, max_retries=MAX_RETRIES,
+                 base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._queues = OrderedDict()
+        self._timer = None
+        self.stats = {"granted": 0, "throttled": 0, "rate_limited": 0, "retries": 0, "failed": 0}
+
+    ### Acquire
+    def _try_take(self, estimate, now):
+        wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(estimate, now))
+        if wait == 0:
+            self.requests.take(1)
+            self.tokens.take(estimate)
+            self.stats["granted"] += 1
+        return wait
+
+    def acquire(self, *, blocking=True):
+        # Synchronous callers bypass the fair queue but still respect the buckets
+        _, estimate = _current_request.get()
+        while True:
+            with self._lock:
+                wait = self._try_take(estimate, time.monotonic())
+            if wait == 0:
+                return True
+            if not blocking:
+                return False
+            self.stats["throttled"] += 1
+            time.sleep(wait)
+
+    async def aacquire(self, *, blocking=True):
+        session, estimate = _current_request.get()
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        entry = {"future": waiter, "estimate": estimate, "throttled": False}
+        with self._lock:
+            self._queues.setdefault(session, deque()).append(entry)
+        self._dispatch()
+        if not waiter.done() and not blocking:
+            waiter.cancel()
+            self._dispatch()
+            return False
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            waiter.cancel()
+            self._dispatch()
+            raise
+        return True
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            while self._queues:
+                session, queue = next(iter(self._queues.items()))
+                entry = queue[0]
+                if entry["future"].done():
+                    queue.popleft()
+                else:
+                    wait = self._try_take(entry["estimate"], time.monotonic())
+                    if wait > 0:
+                        if not entry["throttled"]:
+                            entry["throttled"] = True
+                            self.stats["throttled"] += 1
+                        if self._timer is None or self._timer.when() > loop.time() + wait:
+                            if self._timer is not None:
+                                self._timer.cancel()
+                            self._timer = loop.call_later(wait, self._on_timer)
+                        return
+                    queue.popleft()
+                    entry["future"].set_result(None)
+                    # Round-robin: the session that was just served goes to the back
+                    self._queues.move_to_end(session)
+                if not queue:
+                    del self._queues[session]
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    ### Calls with retries
+    def _retry_delay(self, attempt, exc):
+        response = getattr(exc, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            return min(self.max_delay, float(retry_after)) + random.uniform(0, self.base_delay)
+        except (TypeError, ValueError):
+            return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def _is_retryable(exc):
+        status = getattr(exc, "status_code", None)
+        return isinstance(exc, TRANSIENT_ERRORS) or status in (408, 409, 429) or (status or 0) >= 500
+
+    async def call(self, session, messages, invoke, output_tokens=EXPECTED_OUTPUT_TOKENS):
+        estimate = sum(len(str(m.content)) for m in messages) // 4 + output_tokens
+        token = _current_request.set((session, estimate))
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await invoke()
+                except Exception as exc:
+                    if attempt == self.max_retries or not self._is_retryable(exc):
+                        self.stats["failed"] += 1
+                        raise
+                    if getattr(exc, "status_code", None) == 429:
+                        self.stats["rate_limited"] += 1
+                        with self._lock:
+                            self.requests.drain()
+                            self.tokens.drain()
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(self._retry_delay(attempt, exc))
+                    continue
+                # Settle the token bucket with the real usage when the response reports it
+                usage = getattr(response, "usage_metadata", None)
+                if usage and "total_cost" not in usage:
+                    with self._lock:
+                        self.tokens.take(usage.get("total_tokens", estimate) - estimate)
+                return response
+        finally:
+            _current_request.reset(token)
+
+    def headroom(self):
+        # Requests and estimated tokens that could be granted right now, after the queue
+        with self._lock:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            queued = [entry for queue in self._queues.values() for entry in queue]
+            return (self.requests.level - len(queued),
+                    self.tokens.level - sum(entry["estimate"] for entry in queued))
+
+    def snapshot(self):
+        with self._lock:
+            depth = sum(len(queue) for queue in self._queues.values())
+            return {**self.stats, "queue_depth": depth, "waiting_sessions": len(self._queues),
+                    "request_budget": round(self.requests.level, 1), "token_budget": round(self.tokens.level)}
+
+scheduler = RequestScheduler()
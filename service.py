@@ -0,0 +1,421 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import contextlib
+import multiprocessing
+
+import aiosqlite
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from settings import JOBS_PATH, SERVICE_WORKERS, SERVICE_JOBS_PER_WORKER, SECTION_CONCURRENCY, EDIT_MODE, TOPIC_REUSE
+
+logger = logging.getLogger(__name__)
+
+# Generation service: the graph behind a local HTTP API, e.g.
+#   python service.py --port 8600 --workers 2
+#
+#   POST /jobs                {"topic", "edit_mode"?, "concurrency"?, "reuse"?, "session_id"?, "thread_id"?} -> 202 {"id"}
+#                             or {"revision": {"previous": job id, "outline": [...], "rewrite": [positions]}, ...}
+#                             A topic already queued or running with the same settings returns that job
+#                             (202 {"id", "attached": true}): its events replay from the start as usual.
+#   GET  /jobs/{id}           status, queue position and timings
+#   GET  /jobs/{id}/events    Server-Sent Events, replayed from the start (or after Last-Event-ID / ?after=).
+#                             "restarted" means the job's worker died: the events before it are gone
+#                             and the next attempt sends them again. "retry" means the final edit is
+#                             tried again: the tokens before it are void.
+#   GET  /jobs/{id}/result    outline, draft, final report and metrics once the job is done
+#   GET  /health              live workers and queue depth
+#
+# Jobs and their events live in SQLite (JOBS_PATH); the HTTP process and the worker
+# processes share nothing else. Each worker process builds its own pipeline and claims
+# queued jobs. A job whose worker died is queued again and resumes from its checkpoint.
+
+POLL_INTERVAL = 0.25
+KEEPALIVE_INTERVAL = 15
+# Final-editor tokens are stored as one event per interval instead of one per token
+TOKEN_FLUSH_INTERVAL = 0.25
+# Finished jobs (and their events) older than this are purged on startup
+JOB_RETENTION = 7 * 24 * 3600
+
+### Job store
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    topic TEXT NOT NULL,
+    edit_mode TEXT NOT NULL,
+    concurrency INTEGER NOT NULL,
+    session_id TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    reuse TEXT,
+    revision TEXT,
+    status TEXT NOT NULL,
+    worker INTEGER,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_job ON events (job_id, seq);
+"""
+
+def _jsonable(value):
+    # Graph updates carry pydantic objects (the outline sections)
+    return value.model_dump()
+
+class JobStore:
+    def __init__(self, path=JOBS_PATH):
+        self.path = path
+        self.db = None
+        # Makes the in-flight lookup and the insert of submit() one step
+        self._submitting = asyncio.Lock()
+
+    async def open(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = await aiosqlite.connect(self.path, timeout=30)
+        self.db.row_factory = aiosqlite.Row
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        await self.db.executescript(SCHEMA)
+        await self.db.commit()
+        return self
+
+    async def close(self):
+        await self.db.close()
+
+    async def submit(self, topic, edit_mode, concurrency, session_id=None, thread_id=None, reuse=None, revision=None):
+        # Returns (job id, attached). Single flight: a new topic (not a revision) that is
+        # already queued or running with the same settings gets that job instead of a
+        # second one; topics match ignoring case and spacing, concurrency is not compared
+        async with self._submitting:
+            if not revision:
+                topic = " ".join(topic.split())
+                async with self.db.execute(
+                        "SELECT id FROM jobs WHERE status IN ('queued', 'running') AND revision IS NULL "
+                        "AND lower(topic) = lower(?) AND edit_mode = ? AND coalesce(reuse, ?) = ? ORDER BY created LIMIT 1",
+                        (topic, edit_mode, TOPIC_REUSE, reuse or TOPIC_REUSE)) as cursor:
+                    row = await cursor.fetchone()
+                if row is not None:
+                    return row["id"], True
+            job_id = uuid.uuid4().hex
+            await self.db.execute(
+                "INSERT INTO jobs (id, topic, edit_mode, concurrency, session_id, thread_id, reuse, revision, status, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, topic, edit_mode, concurrency, session_id or job_id, thread_id or f"job-{job_id}", reuse,
+                 json.dumps(revision) if revision else None, time.time()))
+            await self.db.commit()
+            return job_id, False
+
+    async def get(self, job_id):
+        async with self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)) as cursor:
+            row = await cursor.fetchone()
+        return dict(row) if row else None
+
+    async def queue_position(self, job):
+        async with self.db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?",
+                                   (job["created"],)) as cursor:
+            return (await cursor.fetchone())[0]
+
+    async def counts(self):
+        async with self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status") as cursor:
+            return {status: count for status, count in await cursor.fetchall()}
+
+    async def claim(self):
+        # A single UPDATE, so two workers can never claim the same job
+        async with self.db.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started = ? WHERE id = "
+                "(SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1) RETURNING *",
+                (os.getpid(), time.time())) as cursor:
+            row = await cursor.fetchone()
+        await self.db.commit()
+        return dict(row) if row else None
+
+    async def add_event(self, job_id, kind, data):
+        await self.db.execute("INSERT INTO events (job_id, type, data) VALUES (?, ?, ?)",
+                              (job_id, kind, json.dumps(data, default=_jsonable)))
+        await self.db.commit()
+
+    async def events(self, job_id, after=0):
+        async with self.db.execute("SELECT seq, type, data FROM events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                                   (job_id, after)) as cursor:
+            return await cursor.fetchall()
+
+    async def finish(self, job_id, result):
+        await self.db.execute("UPDATE jobs SET status = 'done', finished = ?, result = ? WHERE id = ?",
+                              (time.time(), json.dumps(result, default=_jsonable), job_id))
+        await self.add_event(job_id, "done", {"metrics": result["metrics"], "node_rows": result["node_rows"]})
+
+    async def fail(self, job_id, error):
+        await self.db.execute("UPDATE jobs SET status = 'failed', finished = ?, error = ? WHERE id = ?",
+                              (time.time(), error, job_id))
+        await self.add_event(job_id, "error", {"error": error})
+
+    async def requeue(self, workers=None):
+        # Running jobs of dead workers (all of them on startup) go back to the queue. Their
+        # events are dropped: the next attempt replays whatever its checkpoint restores.
+        # A "restarted" event takes their place, so a client that already saw some of
+        # them (and resumes after them) knows to start its view over
+        where, params = "status = 'running'", ()
+        if workers is not None:
+            where += f" AND worker IN ({', '.join('?' * len(workers))})"
+            params = tuple(workers)
+        async with self.db.execute(f"SELECT id FROM jobs WHERE {where}", params) as cursor:
+            job_ids = [row[0] for row in await cursor.fetchall()]
+        await self.db.execute(f"DELETE FROM events WHERE job_id IN (SELECT id FROM jobs WHERE {where})", params)
+        cursor = await self.db.execute(f"UPDATE jobs SET status = 'queued', worker = NULL, started = NULL WHERE {where}",
+                                       params)
+        await self.db.executemany("INSERT INTO events (job_id, type, data) VALUES (?, 'restarted', '{}')",
+                                  [(job_id,) for job_id in job_ids])
+        await self.db.commit()
+        return cursor.rowcount
+
+    async def purge(self, older_than):
+        finished = "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished < ?"
+        await self.db.execute(f"DELETE FROM events WHERE job_id IN ({finished})", (older_than,))
+        await self.db.execute(f"DELETE FROM jobs WHERE id IN ({finished})", (older_than,))
+        await self.db.commit()
+
+### Worker processes
+async def run_job(store, job):
+    from pipeline import graph, run_config, prepare_run, finish_run, revision_input, run_events
+    from metrics import RunMetrics, export
+    metrics = RunMetrics()
+    config = run_config(job["concurrency"], job["thread_id"], job["edit_mode"], [metrics], job["session_id"],
+                        job["reuse"])
+    tokens, flushed = [], time.monotonic()
+
+    async def flush_tokens():
+        if tokens:
+            await store.add_event(job["id"], "token", {"text": "".join(tokens)})
+            tokens.clear()
+
+    try:
+        graph_input, restored = await prepare_run(job["topic"], config)
+        if graph_input is not None and job["revision"]:
+            # Redo only what changed since the previous job's result
+            revision = json.loads(job["revision"])
+            previous = json.loads((await store.get(revision["previous"]))["result"])
+            graph_input = revision_input({"topic": previous["topic"], "section": previous["outline"],
+                                          "complete_sections": previous["drafts"], "edited_sections": previous["edited"],
+                                          "final_sections": previous["final_sections"],
+                                          "failed_sections": previous.get("failed_sections", [])},
+                                         revision["outline"], set(revision["rewrite"]))
+        # The app's run events, stored as the job's event records
+        async for kind, node, data in run_events(graph_input, restored, config):
+            if kind == "token":
+                if job["edit_mode"] == "single":
+                    tokens.append(data)
+                    if time.monotonic() - flushed >= TOKEN_FLUSH_INTERVAL:
+                        await flush_tokens()
+                        flushed = time.monotonic()
+                continue
+            if kind == "retry":
+                # Tokens of the failed attempt that were not stored yet are dropped with it
+                tokens.clear()
+            await flush_tokens()
+            await store.add_event(job["id"], kind, {"node": node, "update": data} if kind == "update" else
+                                  {"node": node} if kind == "retry" else data or {})
+        state = (await graph.aget_state(config)).values
+    except Exception as exc:
+        logger.exception("job %s failed", job["id"])
+        export(metrics)
+        await store.fail(job["id"], str(exc) or repr(exc))
+        return
+    export(metrics)
+    await finish_run(config, metrics.summary())
+    await store.finish(job["id"], {"topic": job["topic"], "outline": state["section"], "report": state["report"],
+                                   "final": state["final"], "drafts": state["complete_sections"],
+                                   "edited": state.get("edited_sections", []),
+                                   "final_sections": state.get("final_sections", []),
+                                   "failed_sections": state.get("failed_sections", []),
+                                   "metrics": metrics.summary(), "node_rows": metrics.node_rows()})
+
+async def worker_loop(slots):
+    store = await JobStore().open()
+    running = set()
+    while True:
+        job = await store.claim() if len(running) < slots else None
+        if job is None:
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+        task = asyncio.create_task(run_job(store, job))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+def worker_main(slots):
+    # Child process entry point: the pipeline (models, scheduler, checkpointer) is built
+    # here, and jobs run on its shared event loop
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s worker-{os.getpid()} %(levelname)s %(message)s")
+    from pipeline import run_sync
+    run_sync(worker_loop(slots))
+
+### HTTP API
+async def submit(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "expected a JSON body"}, status_code=400)
+    if not isinstance(body, dict):
+        return JSONResponse({"error": "expected a JSON object"}, status_code=400)
+    topic = str(body.get("topic") or "").strip()
+    edit_mode = body.get("edit_mode") or EDIT_MODE
+    if not topic and not body.get("revision"):
+        return JSONResponse({"error": "topic is required"}, status_code=400)
+    if edit_mode not in ("single", "mapreduce"):
+        return JSONResponse({"error": "edit_mode must be 'single' or 'mapreduce'"}, status_code=400)
+    if body.get("reuse") not in (None, "off", "outline", "sections"):
+        return JSONResponse({"error": "reuse must be 'off', 'outline' or 'sections'"}, status_code=400)
+    concurrency = body.get("concurrency")
+    if concurrency is not None and (not isinstance(concurrency, int) or isinstance(concurrency, bool) or concurrency < 1):
+        return JSONResponse({"error": "concurrency must be a positive integer"}, status_code=400)
+    for key in ("session_id", "thread_id"):
+        if body.get(key) is not None and not isinstance(body[key], str):
+            return JSONResponse({"error": f"{key} must be a string"}, status_code=400)
+    revision, reuse = body.get("revision"), body.get("reuse")
+    if revision is not None and not isinstance(revision, dict):
+        return JSONResponse({"error": "revision must be an object"}, status_code=400)
+    if revision:
+        previous = await request.app.state.store.get(str(revision.get("previous")))
+        if previous is None or previous["status"] != "done":
+            return JSONResponse({"error": "revision.previous must be a finished job"}, status_code=400)
+        outline, rewrite = revision.get("outline"), revision.get("rewrite") or []
+        if not isinstance(outline, list) or not outline or \
+                not all(isinstance(sec, dict) and isinstance(sec.get("name"), str) and sec["name"].strip() and
+                        isinstance(sec.get("description"), str) for sec in outline):
+            return JSONResponse({"error": "revision.outline must list at least one section ({\"name\", \"description\"})"},
+                                status_code=400)
+        if not isinstance(rewrite, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in rewrite):
+            return JSONResponse({"error": "revision.rewrite must list section positions"}, status_code=400)
+        names = [sec["name"] for sec in outline]
+        if len(set(names)) != len(names):
+            return JSONResponse({"error": "revision.outline section names must be unique"}, status_code=400)
+        # Revisions always edit per section so the final pass can be partial, and never start from other topics
+        topic, edit_mode, reuse = previous["topic"], "mapreduce", "off"
+        revision = {"previous": previous["id"], "outline": outline, "rewrite": rewrite}
+    job_id, attached = await request.app.state.store.submit(topic, edit_mode, concurrency or SECTION_CONCURRENCY,
+                                                            body.get("session_id"), body.get("thread_id"), reuse, revision)
+    if attached:
+        return JSONResponse({"id": job_id, "attached": True}, status_code=202)
+    return JSONResponse({"id": job_id, "status": "queued"}, status_code=202)
+
+async def status(request):
+    store = request.app.state.store
+    job = await store.get(request.path_params["job_id"])
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    job.pop("result")
+    job["queue_position"] = await store.queue_position(job) if job["status"] == "queued" else None
+    return JSONResponse(job)
+
+async def result(request):
+    job = await request.app.state.store.get(request.path_params["job_id"])
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    if job["status"] != "done":
+        return JSONResponse({"status": job["status"], "error": job["error"]}, status_code=409)
+    return JSONResponse(json.loads(job["result"]))
+
+async def events(request):
+    store = request.app.state.store
+    job_id = request.path_params["job_id"]
+    if await store.get(job_id) is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    try:
+        after = int(request.headers.get("last-event-id") or request.query_params.get("after") or 0)
+    except ValueError:
+        after = -1
+    if after < 0:
+        return JSONResponse({"error": "Last-Event-ID / after must be an event id"}, status_code=400)
+
+    async def stream():
+        cursor, quiet = after, time.monotonic()
+        while True:
+            for seq, kind, data in await store.events(job_id, cursor):
+                cursor, quiet = seq, time.monotonic()
+                yield f"id: {seq}\nevent: {kind}\ndata: {data}\n\n"
+                if kind in ("done", "error"):
+                    return
+            if await request.is_disconnected():
+                return
+            if time.monotonic() - quiet >= KEEPALIVE_INTERVAL:
+                quiet = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(POLL_INTERVAL)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def health(request):
+    workers = request.app.state.workers
+    return JSONResponse({"workers": sum(w.is_alive() for w in workers), "configured_workers": len(workers),
+                         **{status: count for status, count in (await request.app.state.store.counts()).items()}})
+
+def create_app(workers=SERVICE_WORKERS, jobs_per_worker=SERVICE_JOBS_PER_WORKER):
+    context = multiprocessing.get_context("spawn")
+
+    def spawn():
+        process = context.Process(target=worker_main, args=(jobs_per_worker,), name="report-worker", daemon=True)
+        process.start()
+        return process
+
+    async def supervise(app):
+        # Replace workers that died and put their jobs back in the queue
+        while True:
+            await asyncio.sleep(5)
+            for i, process in enumerate(app.state.workers):
+                if not process.is_alive():
+                    requeued = await app.state.store.requeue([process.pid])
+                    logger.warning("worker %s exited (%s); %s job(s) requeued", process.pid, process.exitcode, requeued)
+                    app.state.workers[i] = spawn()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        app.state.store = store = await JobStore().open()
+        await store.purge(time.time() - JOB_RETENTION)
+        requeued = await store.requeue()
+        if requeued:
+            logger.info("%s interrupted job(s) requeued", requeued)
+        app.state.workers = [spawn() for _ in range(workers)]
+        supervisor = asyncio.create_task(supervise(app))
+        try:
+            yield
+        finally:
+            supervisor.cancel()
+            for process in app.state.workers:
+                process.terminate()
+            for process in app.state.workers:
+                process.join(timeout=5)
+            await store.close()
+
+    return Starlette(routes=[
+        Route("/jobs", submit, methods=["POST"]),
+        Route("/jobs/{job_id}", status),
+        Route("/jobs/{job_id}/events", events),
+        Route("/jobs/{job_id}/result", result),
+        Route("/health", health),
+    ], lifespan=lifespan)
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Run the report generation service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="Worker processes running the graph")
+    parser.add_argument("--jobs-per-worker", type=int, default=SERVICE_JOBS_PER_WORKER,
+                        help="Reports each worker process generates at the same time")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(create_app(args.workers, args.jobs_per_worker), host=args.host, port=args.port)
@@ -0,0 +1,156 @@
+import os
+from dotenv import load_dotenv
+
+# Lightweight, import-once configuration shared by the UI, the pipeline and the
+# command-line tools. Nothing here imports LangChain/LangGraph, so the Streamlit
+# page can render before the heavy modules are loaded.
+
+# Load environment variables
+load_dotenv()
+GROQ_API_KEY = os.getenv("groq_api_key") or os.getenv("GROQ_API_KEY")
+if GROQ_API_KEY:
+    os.environ["GROQ_API_KEY"] = GROQ_API_KEY
+
+### Model provider
+# "groq" talks to the Groq API; "fake" swaps in the offline FakeChatModel (fake_llm.py)
+# so orchestration can be measured without network calls or token cost.
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")
+FAKE_LLM_LATENCY = os.getenv("FAKE_LLM_LATENCY", "fixed:0")
+FAKE_LLM_WORDS = int(os.getenv("FAKE_LLM_WORDS", "200"))
+FAKE_LLM_SECTIONS = int(os.getenv("FAKE_LLM_SECTIONS", "6"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_SEED = int(os.environ["FAKE_LLM_SEED"]) if os.getenv("FAKE_LLM_SEED") else None
+
+### Model routing
+# Model id and generation settings per role: "outline" (get_sections), "section"
+# (each_section_output) and "editor" (final, plus per-section polishing and
+# transitions in mapreduce mode), e.g. SECTION_MODEL, SECTION_MAX_TOKENS,
+# SECTION_TEMPERATURE, SECTION_TIMEOUT. Drafting runs on the smaller model by default.
+# The timeout (seconds) bounds one request; a request that hits it is retried by the
+# scheduler like a 5xx. The editor gets longer since it may rewrite the whole report.
+def _route(role, model, timeout):
+    max_tokens = os.getenv(f"{role}_MAX_TOKENS")
+    return {"model": os.getenv(f"{role}_MODEL", model),
+            "max_tokens": int(max_tokens) if max_tokens else None,
+            "temperature": float(os.getenv(f"{role}_TEMPERATURE", "0.7")),
+            "timeout": float(os.getenv(f"{role}_TIMEOUT", timeout))}
+
+MODEL_ROUTES = {
+    "outline": _route("OUTLINE", "openai/gpt-oss-20b", "60"),
+    "section": _route("SECTION", "openai/gpt-oss-20b", "120"),
+    "editor": _route("EDITOR", "openai/gpt-oss-120b", "300"),
+}
+# The outline is retried once on this model when the outline model's structured
+# output fails validation; set it to an empty string to disable escalation.
+ESCALATION_MODEL = os.getenv("ESCALATION_MODEL", "openai/gpt-oss-120b")
+
+### Concurrency
+# Max number of each_section_output workers running at once within a single run.
+# Passed to LangGraph as max_concurrency, so tune it against the Groq quota.
+SECTION_CONCURRENCY = int(os.getenv("SECTION_CONCURRENCY", "8"))
+
+### Report length
+# "blog": one flat outline of 4–8 sections (original behaviour).
+# "long": the outline is a list of chapters, each planned into its own sub-sections
+# and written and edited on its own (see write_chapter in pipeline.py), so reports of
+# 30–100+ sections never go through a single prompt. CHAPTER_CONCURRENCY chapters are
+# written at once, sharing the section writer budget (SECTION_CONCURRENCY).
+REPORT_MODE = os.getenv("REPORT_MODE", "blog")
+CHAPTER_CONCURRENCY = int(os.getenv("CHAPTER_CONCURRENCY", "2"))
+
+### Section batching
+# "auto": consecutive sections are written several per model call (one structured
+# request instead of one call each, so the system prompt is sent once per batch).
+# Batch size adapts to the outline length, SECTION_BATCH_TOKENS (output tokens one
+# call may produce, estimated at EXPECTED_OUTPUT_TOKENS per section) and the rate-limit
+# headroom at the time. "off": one call per section (original behaviour).
+SECTION_BATCHING = os.getenv("SECTION_BATCHING", "off")
+SECTION_BATCH_MAX = int(os.getenv("SECTION_BATCH_MAX", "4"))
+SECTION_BATCH_TOKENS = int(os.getenv("SECTION_BATCH_TOKENS") or MODEL_ROUTES["section"]["max_tokens"] or 4000)
+
+### Rate limits
+# Requests and tokens per minute, shared by every session in this process (see
+# scheduler.py). Set them to your key's Groq limits, divided by the process count.
+GROQ_RPM = float(os.getenv("GROQ_RPM", "1000"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "250000"))
+# Output tokens assumed per call when reserving token budget before the call
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("EXPECTED_OUTPUT_TOKENS", "800"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "60"))
+
+### Fault isolation
+# A reply that comes back malformed (structured output that doesn't validate, empty
+# text) is not a transient error, so the scheduler doesn't retry it; the node that
+# asked for it is attempted NODE_MAX_ATTEMPTS times in all. Section writers, chapters
+# and transitions are retried on their own, and once their attempts are used up the
+# run carries on without them: a failed section becomes a marked placeholder that can
+# be regenerated from the Revise panel, instead of failing the whole report.
+NODE_MAX_ATTEMPTS = int(os.getenv("NODE_MAX_ATTEMPTS", "2"))
+
+### Editing mode
+# "single": one editor call over the whole joined report (original behaviour).
+# "mapreduce": each section worker polishes its own draft right after writing it,
+# and the final pass only rewrites the opening paragraph of each section so it
+# flows from the previous one. Calls are small and run in parallel.
+EDIT_MODE = os.getenv("EDIT_MODE", "single")
+
+### Generation service
+# When set (e.g. http://127.0.0.1:8600), the Streamlit app submits jobs to the
+# generation service (service.py) instead of running the graph in its own process.
+GENERATION_SERVICE_URL = os.getenv("GENERATION_SERVICE_URL", "").rstrip("/")
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "2"))
+# Reports each worker process generates at the same time
+SERVICE_JOBS_PER_WORKER = int(os.getenv("SERVICE_JOBS_PER_WORKER", "4"))
+JOBS_PATH = os.getenv("JOBS_PATH", os.path.join(".cache", "jobs.sqlite"))
+
+### Topic reuse
+# Near-duplicate topic index (topic_index.py). TOPIC_REUSE picks what a new topic
+# takes from the most similar past topic above the threshold: "off", "outline", or
+# "sections" (the outline and the stored section drafts).
+TOPIC_INDEX_ENABLED = os.getenv("TOPIC_INDEX", "1") != "0"
+TOPIC_INDEX_PATH = os.getenv("TOPIC_INDEX_PATH", os.path.join(".cache", "topics"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+TOPIC_REUSE = os.getenv("TOPIC_REUSE", "outline")
+TOPIC_REUSE_THRESHOLD = float(os.getenv("TOPIC_REUSE_THRESHOLD", "0.8"))
+# New vectors are merged into the memory-mapped file in batches (see topic_index.py)
+TOPIC_INDEX_SAVE_EVERY = int(os.getenv("TOPIC_INDEX_SAVE_EVERY", "64"))
+TOPIC_INDEX_SAVE_INTERVAL = float(os.getenv("TOPIC_INDEX_SAVE_INTERVAL", "300"))
+
+### Speculative outline
+# Opt-in (also a sidebar toggle): once a new topic has stayed in the topic box for
+# SPECULATIVE_DEBOUNCE seconds, its outline is generated in the background, and
+# Generate starts from it if the topic is still the same. A newer topic cancels the
+# speculation for the old one. Each browser session may spend at most
+# SPECULATIVE_BUDGET outline calls on speculation.
+SPECULATIVE_OUTLINE = os.getenv("SPECULATIVE_OUTLINE", "0") != "0"
+SPECULATIVE_DEBOUNCE = float(os.getenv("SPECULATIVE_DEBOUNCE", "1.5"))
+SPECULATIVE_BUDGET = int(os.getenv("SPECULATIVE_BUDGET", "5"))
+
+### Report history
+# Every finished report is kept in HISTORY_PATH (SQLite, full-text indexed) and can be
+# searched and reopened from the sidebar.
+HISTORY_ENABLED = os.getenv("HISTORY", "1") != "0"
+HISTORY_PATH = os.getenv("HISTORY_PATH", os.path.join(".cache", "history.sqlite"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+
+### PDF export
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(".cache", "pdf"))
+PDF_CACHE_MAX_MB = float(os.getenv("PDF_CACHE_MAX_MB", "200"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+
+### Checkpoints
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", os.path.join(".cache", "checkpoints.sqlite"))
+
+### LLM cache
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite"))
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "512"))
+
+### Metrics
+# JSON object of model id -> [USD per 1M input tokens, USD per 1M output tokens]
+MODEL_PRICES = os.getenv("MODEL_PRICES")
+# Run metrics are exported with the OTLP/HTTP exporter when an endpoint is configured
+OTEL_ENABLED = bool(os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_METRICS_ENDPOINT"))
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Single-flight: while a run is in progress, identical requests attach to it instead
+# of starting runs of their own. The run is a task on the caller's event loop that
+# records every event it publishes, so a request that attaches late replays them
+# from the start and then follows the live ones. Only runs in progress are shared:
+# a flight is forgotten as soon as it ends (finished reports are not a cache).
+
+class Flight:
+    def __init__(self, key):
+        self.key = key
+        self.events = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.task = None
+        self.followers = 0
+        self._changed = asyncio.Event()
+
+    def publish(self, event):
+        self.events.append(event)
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        # Every event so far, then the live ones until the run ends; raises the run's
+        # error, if it failed. The run is cancelled when its last follower leaves early.
+        seen = 0
+        self.followers += 1
+        try:
+            while True:
+                changed = self._changed
+                while seen < len(self.events):
+                    yield self.events[seen]
+                    seen += 1
+                if self.done:
+                    break
+                await changed.wait()
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.followers -= 1
+            if not self.done and self.followers == 0:
+                logger.info("nobody follows run %r any more; cancelling it", self.key)
+                self.task.cancel()
+
+    async def wait(self):
+        # The run's result, without following its events
+        await asyncio.shield(self.task)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self.stats = {"started": 0, "attached": 0}
+
+    async def join(self, key, start):
+        # Returns (flight, attached). start(flight) is only called when no run for key
+        # is in progress: it publishes the run's events and returns its result.
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.stats["attached"] += 1
+            return flight, True
+        flight = self._flights[key] = Flight(key)
+        flight.task = asyncio.ensure_future(self._run(flight, start))
+        self.stats["started"] += 1
+        return flight, False
+
+    async def _run(self, flight, start):
+        try:
+            flight.result = await start(flight)
+        except BaseException as exc:
+            # Kept for the followers (cancellation included) instead of failing the task
+            flight.error = exc
+        finally:
+            flight.done = True
+            self._flights.pop(flight.key, None)
+            flight._wake()
+
+    def in_flight(self):
+        return len(self._flights)
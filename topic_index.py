@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import atexit
+import threading
+
+import numpy as np
+
+from settings import (TOPIC_INDEX_ENABLED, TOPIC_INDEX_PATH, EMBEDDING_MODEL, TOPIC_REUSE_THRESHOLD, TOPIC_INDEX_SAVE_EVERY,
+                      TOPIC_INDEX_SAVE_INTERVAL)
+
+logger = logging.getLogger(__name__)
+
+# Near-duplicate topic index: past topics are embedded locally (sentence-transformers)
+# and searched with faiss, so "Intro to ML" can reuse the outline (and optionally the
+# section drafts) written for "Getting started with machine learning".
+#
+# <path>.sqlite holds the topics and what was generated for them and is the source of
+# truth; <path>.faiss holds their normalized embeddings (inner product = cosine) and is
+# memory-mapped on load (IO_FLAG_MMAP_IFC: the flat vectors stay on disk). Vectors
+# added since the last save live in a small in-memory index next to the mapped one and
+# are merged into the file once TOPIC_INDEX_SAVE_EVERY of them have piled up, or
+# TOPIC_INDEX_SAVE_INTERVAL seconds after the last save, and at exit. Vectors that
+# never got saved are rebuilt from the sqlite rows on the next load. Rows written by
+# other processes are picked up (and embedded) on the next lookup, keyed by their row id.
+
+class TopicIndex:
+    def __init__(self, path=TOPIC_INDEX_PATH, model_name=EMBEDDING_MODEL, threshold=TOPIC_REUSE_THRESHOLD):
+        import faiss
+        from sentence_transformers import SentenceTransformer
+        self.faiss = faiss
+        self.path = path
+        self.threshold = threshold
+        self.encoder = SentenceTransformer(model_name)
+        self.dim = self.encoder.get_sentence_embedding_dimension()
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path + ".sqlite", check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS topics (id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL UNIQUE, "
+            "outline TEXT NOT NULL, drafts TEXT NOT NULL, edited TEXT NOT NULL, created REAL NOT NULL)")
+        self.conn.commit()
+        self._load()
+
+    ### Vectors
+    def _embed(self, texts):
+        return self.encoder.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+    def _empty(self):
+        return self.faiss.IndexIDMap2(self.faiss.IndexFlatIP(self.dim))
+
+    def _load(self):
+        if os.path.exists(self.path + ".faiss"):
+            self.base = self.faiss.read_index(self.path + ".faiss", self.faiss.IO_FLAG_MMAP_IFC)
+        else:
+            self.base = self._empty()
+        self.delta = self._empty()
+        self.saved = time.monotonic()
+        ids = self.faiss.vector_to_array(self.base.id_map) if self.base.ntotal else []
+        self.last_id = int(max(ids)) if len(ids) else 0
+        self._sync()
+
+    def _sync(self):
+        # Embed rows this process has not indexed yet (new, or written by another process)
+        rows = self.conn.execute("SELECT id, topic FROM topics WHERE id > ? ORDER BY id", (self.last_id,)).fetchall()
+        if rows:
+            self.delta.add_with_ids(self._embed([topic for _, topic in rows]), np.array([i for i, _ in rows], dtype=np.int64))
+            self.last_id = rows[-1][0]
+        return bool(rows)
+
+    def _save(self):
+        # Merge the mapped and in-memory vectors into a new file and map that one instead
+        merged = self._empty()
+        for index in (self.base, self.delta):
+            if index.ntotal:
+                merged.add_with_ids(index.index.reconstruct_n(0, index.ntotal), self.faiss.vector_to_array(index.id_map))
+        self.faiss.write_index(merged, self.path + ".faiss.tmp")
+        os.replace(self.path + ".faiss.tmp", self.path + ".faiss")
+        self.base = self.faiss.read_index(self.path + ".faiss", self.faiss.IO_FLAG_MMAP_IFC)
+        self.delta = self._empty()
+        self.saved = time.monotonic()
+
+    def flush(self):
+        # Writes out the vectors still held in memory
+        with self._lock:
+            if self.delta.ntotal:
+                self._save()
+
+    ### Lookup and record
+    def match(self, topic):
+        # Best stored topic at or above the threshold, or None
+        with self._lock:
+            self._sync()
+            query = self._embed([topic])
+            best = (-1.0, -1)
+            for index in (self.base, self.delta):
+                if index.ntotal:
+                    scores, ids = index.search(query, 1)
+                    best = max(best, (float(scores[0][0]), int(ids[0][0])))
+            score, row_id = best
+            if row_id < 0 or score < self.threshold:
+                return None
+            row = self.conn.execute("SELECT topic, outline, drafts, edited FROM topics WHERE id = ?", (row_id,)).fetchone()
+        if row is None:
+            return None
+        return {"topic": row[0], "score": score, "outline": json.loads(row[1]),
+                "drafts": json.loads(row[2]), "edited": json.loads(row[3])}
+
+    def add(self, topic, outline, drafts, edited):
+        with self._lock:
+            # The same topic again replaces what was stored; its vector does not change
+            self.conn.execute(
+                "INSERT INTO topics (topic, outline, drafts, edited, created) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(topic) DO UPDATE SET outline = excluded.outline, drafts = excluded.drafts, "
+                "edited = excluded.edited, created = excluded.created",
+                (topic, json.dumps(outline), json.dumps(drafts), json.dumps(edited), time.time()))
+            self.conn.commit()
+            self._sync()
+            if self.delta.ntotal >= TOPIC_INDEX_SAVE_EVERY or \
+                    (self.delta.ntotal and time.monotonic() - self.saved >= TOPIC_INDEX_SAVE_INTERVAL):
+                self._save()
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    # Built on first use: loading the embedding model takes a few seconds. None when the
+    # index is disabled or can't be built (faiss / sentence-transformers not installed,
+    # the model can't be downloaded, an unreadable index file): similar-topic reuse is
+    # then skipped for the rest of the process instead of failing every run.
+    global _index
+    with _index_lock:
+        if _index is None and TOPIC_INDEX_ENABLED:
+            try:
+                _index = TopicIndex()
+                atexit.register(_index.flush)
+            except ImportError as exc:
+                logger.warning("topic index disabled: %s", exc)
+                _index = False
+            except Exception:
+                logger.exception("topic index disabled: it could not be loaded")
+                _index = False
+        return _index or None